@@ -0,0 +1,165 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# Fichiers source des séries surveillées
+FICHIER_BRANCHE = "base_creance_branche_finale.xlsx"
+FICHIER_CONT = "base_contentieux_finale_v2.xlsx"
+FICHIER_ALERTES = "alertes.csv"
+
+# Libellé utilisé pour les séries contentieuses, qui ne sont pas ventilées par branche
+TOUTES_BRANCHES = "TOUTES"
+
+# Seuils par défaut : z-score robuste et quantile normal de l'intervalle de crédibilité (95 %)
+SEUIL_Z = 3.5
+QUANTILE_IC = 1.96
+
+
+def build_cube(df, *colonnes):
+    """Projette les colonnes de df sur des tableaux denses (annee, NOM_DR, BRANCHE).
+
+    Les cellules absentes valent NaN ; une cellule présente sur plusieurs lignes lève
+    une ValueError. Retourne (annees, drs, branches, *tableaux).
+    """
+    annee = pd.Categorical(df["annee"])
+    dr = pd.Categorical(df["NOM_DR"])
+    branche = pd.Categorical(df["BRANCHE"])
+    shape = (len(annee.categories), len(dr.categories), len(branche.categories))
+    idx = (annee.codes, dr.codes, branche.codes)
+
+    doublons = df.duplicated(["annee", "NOM_DR", "BRANCHE"])
+    if doublons.any():
+        cles = df.loc[doublons, ["annee", "NOM_DR", "BRANCHE"]].drop_duplicates().to_records(index=False).tolist()
+        raise ValueError(f"Plusieurs lignes pour les cellules {cles}")
+
+    tableaux = []
+    for colonne in colonnes:
+        tableau = np.full(shape, np.nan)
+        tableau[idx] = df[colonne].to_numpy(dtype=float)
+        tableaux.append(tableau)
+    return (annee.categories, dr.categories, branche.categories, *tableaux)
+
+
+def score_jumps(valeurs, ecarts, seuil_z=SEUIL_Z, quantile=QUANTILE_IC):
+    """Score les sauts d'une année sur l'autre d'un cube (annee, ...).
+
+    - z robuste : (delta - médiane) / (1.4826 * MAD), calculé pour chaque transition
+      d'année et chaque branche sur l'ensemble des DR (axe 1) ;
+    - test de recouvrement : les intervalles de crédibilité a posteriori des deux
+      années sont disjoints si |delta| > quantile * (sd_t + sd_t-1).
+
+    Une cellule est en alerte quand les deux critères sont vérifiés. Sans écarts types
+    (ecarts=None), le test de recouvrement n'est pas fait (disjoint vaut None) et
+    l'alerte repose sur le seul z robuste.
+    """
+    delta = np.diff(valeurs, axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mediane = np.nanmedian(delta, axis=1, keepdims=True)
+        mad = 1.4826 * np.nanmedian(np.abs(delta - mediane), axis=1, keepdims=True)
+        z = (delta - mediane) / mad
+        # Si plus de la moitié des cellules ne bougent pas, le MAD est nul : tout saut non nul est extrême
+        z = np.where(mad > 0, z, np.sign(delta - mediane) * np.where(delta == mediane, 0.0, np.inf))
+
+        if ecarts is None:
+            disjoint = None
+        else:
+            marge = quantile * (ecarts[1:] + ecarts[:-1])
+            disjoint = np.abs(delta) > marge
+
+    alerte = np.abs(z) > seuil_z
+    if disjoint is not None:
+        alerte &= disjoint
+    return delta, z, disjoint, alerte
+
+
+def prepare_series(df_br, df_cont):
+    """Construit les séries surveillées avec leur écart type a posteriori.
+
+    L'écart type de proba_bayesienne = a_priori * cond / marginale est propagé depuis
+    celui de la probabilité conditionnelle estimée sur des effectifs (méthode delta).
+    La criticité n'a pas d'écart type (None) : les classeurs ne donnent que la moyenne
+    des montants, pas leur dispersion.
+    """
+    br = df_br.copy()
+    # sd de proba_cond = creance_signif / creance_signif_par_dr : loi Beta(k + 1, n - k + 1),
+    # non nulle quand k vaut 0 ou n, contrairement à l'écart type binomial
+    k = br["creance_signif"].to_numpy(dtype=float)
+    n = br["creance_signif_par_dr"].to_numpy(dtype=float)
+    a, b = k + 1, n - k + 1
+    sd_cond = np.sqrt(a * b / ((a + b) ** 2 * (a + b + 1)))
+    br["sd_proba"] = (br["proba_a_priori"] / br["proba_marginale"] * sd_cond).fillna(0.0)
+    br["criticite"] = br["proba_bayesienne"] * br["moyenne_montant_creances_sinif"]
+
+    # Une DR peut apparaître sur plusieurs lignes la même année : les créances contentieuses
+    # sont cumulées, sum_creance_signif (total de la DR, répété sur chaque ligne) est compté une fois
+    cont = df_cont.groupby(["annee", "NOM_DR"], as_index=False).agg(
+        creance_signif_cont=("creance_signif_cont", "sum"),
+        sum_creance_signif=("sum_creance_signif", "max"),
+    )
+    # Ratio contentieux / significatives : moyenne et sd de la loi Beta(k + 1, n - k + 1)
+    k = cont["creance_signif_cont"].to_numpy(dtype=float)
+    n = cont["sum_creance_signif"].to_numpy(dtype=float)
+    a, b = k + 1, n - k + 1
+    cont["ratio_contentieux"] = np.where(n > 0, k / np.where(n > 0, n, 1), np.nan)
+    cont["sd_ratio"] = np.sqrt(a * b / ((a + b) ** 2 * (a + b + 1)))
+    cont["BRANCHE"] = TOUTES_BRANCHES
+
+    return {
+        "proba_bayesienne": (br, "proba_bayesienne", "sd_proba"),
+        "criticite": (br, "criticite", None),
+        "ratio_contentieux": (cont, "ratio_contentieux", "sd_ratio"),
+    }
+
+
+def detect_alerts(df_br, df_cont, seuil_z=SEUIL_Z, quantile=QUANTILE_IC):
+    """Retourne un DataFrame de toutes les transitions scorées, avec la colonne 'alerte'."""
+    resultats = []
+    for indicateur, (df, valeur, ecart_type) in prepare_series(df_br, df_cont).items():
+        if ecart_type is None:
+            annees, drs, branches, valeurs = build_cube(df, valeur)
+            ecarts = None
+        else:
+            annees, drs, branches, valeurs, ecarts = build_cube(df, valeur, ecart_type)
+        delta, z, disjoint, alerte = score_jumps(valeurs, ecarts, seuil_z, quantile)
+
+        # Aplatir le cube des transitions en table longue
+        grille = pd.MultiIndex.from_product(
+            [annees[1:], drs, branches], names=["annee", "NOM_DR", "BRANCHE"]
+        ).to_frame(index=False)
+        grille["indicateur"] = indicateur
+        grille["valeur_precedente"] = valeurs[:-1].ravel()
+        grille["valeur"] = valeurs[1:].ravel()
+        grille["variation"] = delta.ravel()
+        grille["z_robuste"] = z.ravel()
+        # Sans écart type, le test de recouvrement est sans objet
+        grille["ic_disjoints"] = disjoint.ravel() if disjoint is not None else np.nan
+        grille["alerte"] = alerte.ravel()
+        resultats.append(grille[grille["variation"].notna()])
+
+    return pd.concat(resultats, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Détection des sauts annuels sur les séries de risque.")
+    parser.add_argument("--sortie", default=FICHIER_ALERTES, help="Fichier CSV des alertes")
+    parser.add_argument("--seuil-z", type=float, default=SEUIL_Z, help="Seuil du z-score robuste")
+    parser.add_argument("--quantile", type=float, default=QUANTILE_IC, help="Quantile normal des intervalles de crédibilité")
+    parser.add_argument("--toutes", action="store_true", help="Écrire toutes les transitions, pas seulement les alertes")
+    args = parser.parse_args()
+
+    debut = time.perf_counter()
+    df_br = pd.read_excel(FICHIER_BRANCHE)
+    df_cont = pd.read_excel(FICHIER_CONT)
+    df_scores = detect_alerts(df_br, df_cont, args.seuil_z, args.quantile)
+
+    df_sortie = df_scores if args.toutes else df_scores[df_scores["alerte"]]
+    df_sortie.to_csv(args.sortie, index=False)
+    print(f"{int(df_scores['alerte'].sum())} alertes sur {len(df_scores)} transitions "
+          f"-> {args.sortie} ({time.perf_counter() - debut:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+
+import alertes
+import donnees
+
+
+def main():
+    # Configurer la page pour utiliser toute la largeur
+    st.set_page_config(layout="wide")
+
+    st.title("Alertes sur les variations annuelles du risque")
+    st.markdown("Cette section met en évidence les sauts d'une année sur l'autre de la probabilité bayésienne, de la criticité et du ratio contentieux/significatives, pour chaque couple DR × branche. Une alerte combine un z-score robuste élevé et des intervalles de crédibilité a posteriori disjoints ; pour la criticité, dont la dispersion des montants n'est pas connue, le z-score seul est retenu.")
+
+    # Charger les données localement
+    @st.cache_data
+    def load_scores(df_br, df_cont, seuil_z, quantile):
+        return alertes.detect_alerts(df_br, df_cont, seuil_z, quantile)
+
+    @st.cache_data
+    def load_alert_file(path, mtime):
+        return pd.read_csv(path)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        seuil_z = st.slider("Seuil du z-score robuste", 2.0, 6.0, alertes.SEUIL_Z, 0.5)
+    with col2:
+        quantile = st.slider("Quantile des intervalles de crédibilité", 1.0, 3.0, alertes.QUANTILE_IC, 0.01)
+
+    # Les deux classeurs sont tirés du même instantané des données
+    snap = donnees.snapshot()
+    df_scores = load_scores(donnees.load(alertes.FICHIER_BRANCHE, snap), donnees.load(alertes.FICHIER_CONT, snap), seuil_z, quantile)
+
+    # Rappeler le dernier fichier produit par le traitement batch
+    if os.path.exists(alertes.FICHIER_ALERTES):
+        df_batch = load_alert_file(alertes.FICHIER_ALERTES, os.path.getmtime(alertes.FICHIER_ALERTES))
+        st.caption(f"Dernier traitement batch : {len(df_batch)} alertes dans {alertes.FICHIER_ALERTES}")
+
+    indicateurs = sorted(df_scores["indicateur"].unique())
+    selected_indicateur = st.selectbox("Sélectionnez un indicateur", indicateurs)
+    df_ind = df_scores[df_scores["indicateur"] == selected_indicateur]
+
+    # Carte des alertes : nombre d'alertes par DR et par année
+    st.markdown("### Nombre d'alertes par DR et par année")
+    carte = df_ind.pivot_table(index="NOM_DR", columns="annee", values="alerte", aggfunc="sum", fill_value=0)
+    fig_heatmap = px.imshow(
+        carte,
+        labels=dict(x="Année", y="Direction Régionale (DR)", color="Alertes"),
+        color_continuous_scale="Reds",
+        text_auto=True
+    )
+    st.plotly_chart(fig_heatmap, use_container_width=True)
+
+    # Tableau des transitions, les alertes surlignées
+    st.markdown("### Détail des transitions")
+    only_alerts = st.checkbox("Afficher uniquement les alertes", value=True)
+    df_table = df_ind[df_ind["alerte"]] if only_alerts else df_ind
+    df_table = df_table.sort_values(by="z_robuste", key=lambda s: s.abs(), ascending=False)
+
+    def highlight(row):
+        couleur = "background-color: #f5c6c6" if row["alerte"] else ""
+        return [couleur] * len(row)
+
+    st.dataframe(df_table.style.apply(highlight, axis=1), use_container_width=True)
+
+
+if __name__ == "__main__":
+    main()
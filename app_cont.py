@@ -1,24 +1,26 @@
+import os
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 
-def main():
-    # Configurer la page pour utiliser toute la largeur
-    st.set_page_config(layout="wide")
-
-    # Charger les données localement
-    @st.cache_data
-    def load_data_cont():
-        df_cont = pd.read_excel("base_contentieux_finale_v2.xlsx")
-        return df_cont
+import contrats_store
+import donnees
+import markov_cont
 
-    df_cont = load_data_cont()
+# Charger les données localement
+def load_data_cont(snap=None):
+    df_cont = donnees.load("base_contentieux_finale_v2.xlsx", snap)
+    return df_cont
 
-    st.title("Analyse des Créances contentieuses par Direction Régionale (DR)")
-    st.markdown("Cette section permet de visualiser les créances contentieuses par Direction Régionale (DR) et d'analyser les risques associés en nombre et en montant moyen.")
+def load_data_creance_info(snap=None):
+    df = donnees.load("base_creance_info_v3.xlsx", snap)
+    df = df[["annee", "NOM_DR", "BRANCHE", "nb_contrats_gt1000", "nb_contrats_0_1000"]]
+    return df
 
+def compute_creances_par_annee(df_cont):
     # Calculer le nombre total de créances significatives et le nombre de créances contentieuses par année
     creances_par_annee = df_cont.groupby('annee').agg({
         'sum_creance_signif': 'sum',
@@ -34,17 +36,16 @@ def main():
                                                         "sum_creance_signif":"Nombre de créances significatives",
                                                         "creance_signif_cont":"Nombre créances contentieuses",
                                                         'pourcentage_contentieuses': "Créances contentieuses/Créances significatives (%)"})
-    # Afficher le tableau des pourcentages
-    st.markdown("### Pourcentage de créances contentieuses parmi les créances significatives par année")
-    st.write(creances_par_annee)
+    return creances_par_annee
 
+def generate_pourcentage_chart(creances_par_annee):
     # Créer un graphique en ligne pour montrer l'évolution du pourcentage au fil des années
     fig_line = px.line(
         creances_par_annee,
         x='Année',
         y="Créances contentieuses/Créances significatives (%)",
         title="Évolution du pourcentage de créances contentieuses parmi les créances significatives",
-        
+
     )
 
     # Mettre à jour la mise en page du graphique en ligne
@@ -53,168 +54,209 @@ def main():
         yaxis_title="créances contentieuses/créances significatives (%)",
         yaxis=dict(ticksuffix="%")
     )
+    return fig_line
+
+# Dictionnaire des abréviations pour les DR
+abbreviations = {
+    "ALGER1": "ALG1",
+    "ALGER2": "ALG2",
+    "ALGER3": "ALG3",
+    "ANNABA": "ANN",
+    "BATNA": "BAT",
+    "BECHAR": "BECH",
+    "BLIDA": "BLI",
+    "CONSTANTINE": "CON",
+    "CORPORATE": "COR",
+    "ORAN": "ORA",
+    "OUARGLA": "OUAR",
+    "RELIZANE": "REL",
+    "SBA": "SBA",
+    "SETIF": "SET",
+    "TIZIOUZOU": "TIZI",
+    "TLEMCEN": "TLE"
+}
+
+# Fonction pour générer le scatter plot des créances contentieuses
+def generate_cont_scatter_plot(df_cont, year):
+    df_filtered = df_cont[df_cont['annee'] == year].copy()
+    df_filtered['montant_moyen_creances'] = df_filtered['somme_montant_creance'] / df_filtered['creance_signif_cont']
+    df_filtered['NOM_DR'] = df_filtered['NOM_DR'].map(abbreviations)
+
+    mean_creances_signif = df_filtered['creance_signif_cont'].mean()
+    mean_montant_moyen_creances = df_filtered['montant_moyen_creances'].mean()
+    # Créer une grille pour le dégradé de couleur
+    x = np.linspace(df_filtered['creance_signif_cont'].min(), df_filtered['creance_signif_cont'].max(), 100)
+    y = np.linspace(df_filtered['montant_moyen_creances'].min(), df_filtered['montant_moyen_creances'].max(), 100)
+    X, Y = np.meshgrid(x, y)
+
+    # Calculer la probabilité bayésienne comme une fonction de X et Y (exemple simplifié)
+    Z = (X - X.min()) / (X.max() - X.min()) * (Y - Y.min()) / (Y.max() - Y.min())  # Normalisation dynamique  # Normalisation pour créer un dégradé
+
+    # Créer la figure
+    fig = go.Figure()
+
+    # Ajouter le dégradé de couleur en arrière-plan
+    fig.add_trace(go.Contour(
+        x=x,
+        y=y,
+        z=Z,
+        colorscale=[
+        [0, "#baf5bd"],  # Vert clair
+        [0.02, "#c8f5b3"],  # Vert-jaune clair
+        [0.08, "#eff595"],  # Jaune
+        [0.35, "#f5e88b"],  # Jaune-orange clair
+        [0.42, "#f5d97f"],  # Orange clair
+        [0.49, "#f5ca73"],  # Orange
+        # [0.56, "#f5bb67"],  # Orange-rouge clair
+        # [0.63, "#f5ac5b"],  # Orange-rouge
+        # [0.7, "#f57c42"],  # Rouge-orange
+        [0.77, "#f55c36"],  # Rouge clair
+        [0.84, "#f53c2a"],  # Rouge moyen
+        [0.91, "#f51c1e"],  # Rouge foncé
+        [1, "#f50012"]  # Rouge intense
+        ],  # Dégradé de vert à rouge
+        ncontours=50,
+        showscale=True,
+        colorbar=dict(title="barre du risque",
+                      tickfont=dict(size=10),
+                      len=0.4,
+                      x=1.3,
+                      xanchor="right",
+                      y=0.5,
+                      yanchor="bottom"
+                      ),    # afficher la barre de couleur
+        opacity=0.4       # Rendre le dégradé semi-transparent
+    ))
+
+
+    fig.add_trace(go.Scatter(
+        x=df_filtered['creance_signif_cont'],
+        y=df_filtered['montant_moyen_creances'],
+        mode='markers+text',
+        text=df_filtered['NOM_DR'],
+        textposition='top center',
+        name=f"Année {year}",
+        marker=dict(size=10, color='blue'),
+        textfont=dict(size=12)
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=[mean_creances_signif, mean_creances_signif],
+        y=[df_filtered['montant_moyen_creances'].min(), df_filtered['montant_moyen_creances'].max()],
+        mode='lines',
+        line=dict(color='red', dash='dot'),
+        name=f"nombre moyen de créances contentieuses (Année {year})"
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=[df_filtered['creance_signif_cont'].min(), df_filtered['creance_signif_cont'].max()],
+        y=[mean_montant_moyen_creances, mean_montant_moyen_creances],
+        mode='lines',
+        line=dict(color='blue', dash='dot'),
+        name=f"moyenne des montants moyens des créances significatives (Année {year})"
+    ))
+
+
+    fig.update_layout(
+        title=dict(
+            #x=0.5,
+            y=0.95,    
+            text=f"Cartographie du risque de créances contentieuses par DR pour l'année {year}"),
+        xaxis_title="Nombre de créances contentieuses",
+        yaxis_title="Montant moyen des créances contentieuses",
+        template="plotly_white",
+        width=900,
+        height=600,
+        legend=dict(
+            yanchor="top",
+            y=-0.2,
+            xanchor="center",
+            x=0.5
+        ),
+        font=dict(color="black", size=10),
+        title_font=dict(color="black", size=12),
+        xaxis=dict(
+            tickfont=dict(color="black", size=10),
+            showgrid=False,
+            title=dict(font=dict(color="black", size=12))
+        ),
+        yaxis=dict(
+            tickfont=dict(color="black", size=10),
+            showgrid=False,
+            title=dict(font=dict(color="black", size=10))
+        )
+    )
 
-    # Afficher le graphique en ligne
-    st.plotly_chart(fig_line)
-
-    # Dictionnaire des abréviations pour les DR
-    abbreviations = {
-        "ALGER1": "ALG1",
-        "ALGER2": "ALG2",
-        "ALGER3": "ALG3",
-        "ANNABA": "ANN",
-        "BATNA": "BAT",
-        "BECHAR": "BECH",
-        "BLIDA": "BLI",
-        "CONSTANTINE": "CON",
-        "CORPORATE": "COR",
-        "ORAN": "ORA",
-        "OUARGLA": "OUAR",
-        "RELIZANE": "REL",
-        "SBA": "SBA",
-        "SETIF": "SET",
-        "TIZIOUZOU": "TIZI",
-        "TLEMCEN": "TLE"
-    }
-
-    # Fonction pour générer le scatter plot des créances contentieuses
-    def generate_cont_scatter_plot(year):
-        df_filtered = df_cont[df_cont['annee'] == year].copy()
-        df_filtered['montant_moyen_creances'] = df_filtered['somme_montant_creance'] / df_filtered['creance_signif_cont']
-        df_filtered['NOM_DR'] = df_filtered['NOM_DR'].map(abbreviations)
-
-        mean_creances_signif = df_filtered['creance_signif_cont'].mean()
-        mean_montant_moyen_creances = df_filtered['montant_moyen_creances'].mean()
-        # Créer une grille pour le dégradé de couleur
-        x = np.linspace(df_filtered['creance_signif_cont'].min(), df_filtered['creance_signif_cont'].max(), 100)
-        y = np.linspace(df_filtered['montant_moyen_creances'].min(), df_filtered['montant_moyen_creances'].max(), 100)
-        X, Y = np.meshgrid(x, y)
-
-        # Calculer la probabilité bayésienne comme une fonction de X et Y (exemple simplifié)
-        Z = (X - X.min()) / (X.max() - X.min()) * (Y - Y.min()) / (Y.max() - Y.min())  # Normalisation dynamique  # Normalisation pour créer un dégradé
-
-        # Créer la figure
-        fig = go.Figure()
-
-        # Ajouter le dégradé de couleur en arrière-plan
-        fig.add_trace(go.Contour(
-            x=x,
-            y=y,
-            z=Z,
-            colorscale=[
-            [0, "#baf5bd"],  # Vert clair
-            [0.02, "#c8f5b3"],  # Vert-jaune clair
-            [0.08, "#eff595"],  # Jaune
-            [0.35, "#f5e88b"],  # Jaune-orange clair
-            [0.42, "#f5d97f"],  # Orange clair
-            [0.49, "#f5ca73"],  # Orange
-            # [0.56, "#f5bb67"],  # Orange-rouge clair
-            # [0.63, "#f5ac5b"],  # Orange-rouge
-            # [0.7, "#f57c42"],  # Rouge-orange
-            [0.77, "#f55c36"],  # Rouge clair
-            [0.84, "#f53c2a"],  # Rouge moyen
-            [0.91, "#f51c1e"],  # Rouge foncé
-            [1, "#f50012"]  # Rouge intense
-            ],  # Dégradé de vert à rouge
-            ncontours=50,
-            showscale=True,
-            colorbar=dict(title="barre du risque",
-                          tickfont=dict(size=10),
-                          len=0.4,
-                          x=1.3,
-                          xanchor="right",
-                          y=0.5,
-                          yanchor="bottom"
-                          ),    # afficher la barre de couleur
-            opacity=0.4       # Rendre le dégradé semi-transparent
-        ))
-
-
-        fig.add_trace(go.Scatter(
-            x=df_filtered['creance_signif_cont'],
-            y=df_filtered['montant_moyen_creances'],
-            mode='markers+text',
-            text=df_filtered['NOM_DR'],
-            textposition='top center',
-            name=f"Année {year}",
-            marker=dict(size=10, color='blue'),
-            textfont=dict(size=12)
-        ))
-
-        fig.add_trace(go.Scatter(
-            x=[mean_creances_signif, mean_creances_signif],
-            y=[df_filtered['montant_moyen_creances'].min(), df_filtered['montant_moyen_creances'].max()],
-            mode='lines',
-            line=dict(color='red', dash='dot'),
-            name=f"nombre moyen de créances contentieuses (Année {year})"
-        ))
-
-        fig.add_trace(go.Scatter(
-            x=[df_filtered['creance_signif_cont'].min(), df_filtered['creance_signif_cont'].max()],
-            y=[mean_montant_moyen_creances, mean_montant_moyen_creances],
-            mode='lines',
-            line=dict(color='blue', dash='dot'),
-            name=f"moyenne des montants moyens des créances significatives (Année {year})"
-        ))
-
-        
-        fig.update_layout(
-            title=dict(
+    return fig
+
+# Fonction pour générer le radar chart des créances contentieuses
+def generate_cont_radar_chart(df_cont, year):
+    data = df_cont[df_cont['annee'] == year]
+    data_sorted = data.sort_values(by='proba_bayesienne', ascending=False)
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatterpolar(
+        r=data_sorted['proba_bayesienne'],
+        theta=data_sorted['NOM_DR'],
+        name=str(year),
+        fill='toself'
+    ))
+
+    fig.update_layout(
+        polar=dict(radialaxis=dict(visible=True)),
+        title=dict(
+                text=f"Diagramme en Radar du risque de créances contentieuses par DR - {year}",
+                font=dict(color="black", size=12),
                 #x=0.5,
-                y=0.95,    
-                text=f"Cartographie du risque de créances contentieuses par DR pour l'année {year}"),
-            xaxis_title="Nombre de créances contentieuses",
-            yaxis_title="Montant moyen des créances contentieuses",
-            template="plotly_white",
-            width=900,
-            height=600,
-            legend=dict(
-                yanchor="top",
-                y=-0.2,
-                xanchor="center",
-                x=0.5
-            ),
-            font=dict(color="black", size=10),
-            title_font=dict(color="black", size=12),
-            xaxis=dict(
-                tickfont=dict(color="black", size=10),
-                showgrid=False,
-                title=dict(font=dict(color="black", size=12))
-            ),
-            yaxis=dict(
-                tickfont=dict(color="black", size=10),
-                showgrid=False,
-                title=dict(font=dict(color="black", size=10))
-            )
-        )
+                y=0.95),
+        height=400,
+        width=700
+    )
 
-        return fig
-
-    # Fonction pour générer le radar chart des créances contentieuses
-    def generate_cont_radar_chart(year):
-        data = df_cont[df_cont['annee'] == year]
-        data_sorted = data.sort_values(by='proba_bayesienne', ascending=False)
-
-        fig = go.Figure()
-        fig.add_trace(go.Scatterpolar(
-            r=data_sorted['proba_bayesienne'],
-            theta=data_sorted['NOM_DR'],
-            name=str(year),
-            fill='toself'
-        ))
-
-        fig.update_layout(
-            polar=dict(radialaxis=dict(visible=True)),
-            title=dict(
-                    text=f"Diagramme en Radar du risque de créances contentieuses par DR - {year}",
-                    font=dict(color="black", size=12),
-                    #x=0.5,
-                    y=0.95),
-            height=400,
-            width=700
-        )
+    return fig
+
+def prebuild():
+    """Agrégats et figures de la page, indépendants des choix de l'utilisateur, pour le bundle."""
+    snap = donnees.snapshot()
+    df_cont = load_data_cont(snap)
+    creances_par_annee = compute_creances_par_annee(df_cont)
+
+    figures = {"app_cont/line": generate_pourcentage_chart(creances_par_annee)}
+    for year in df_cont['annee'].unique():
+        figures[f"app_cont/scatter/{year}"] = generate_cont_scatter_plot(df_cont, year)
+        figures[f"app_cont/radar/{year}"] = generate_cont_radar_chart(df_cont, year)
+    return {"tables": {"app_cont/creances_par_annee": creances_par_annee}, "figures": figures}
+
+def main():
+    # Un seul instantané des données pour toute l'exécution de la page
+    snap = donnees.snapshot()
+
+    # Configurer la page pour utiliser toute la largeur
+    st.set_page_config(layout="wide")
+
+    @st.cache_data
+    def fit_transitions(df_creance_info, df_cont, raw_mtime):
+        # raw_mtime fait partie de la clé de cache : le fichier brut est lu par markov_cont.fit
+        return markov_cont.fit(df_creance_info, df_cont)
 
-        return fig
+    df_cont = load_data_cont(snap)
+    df_creance_info = load_data_creance_info(snap)
+
+    st.title("Analyse des Créances contentieuses par Direction Régionale (DR)")
+    st.markdown("Cette section permet de visualiser les créances contentieuses par Direction Régionale (DR) et d'analyser les risques associés en nombre et en montant moyen.")
+
+    # Calculer le nombre total de créances significatives et le nombre de créances contentieuses par année
+    creances_par_annee = donnees.table("app_cont/creances_par_annee", compute_creances_par_annee, df_cont, snap=snap)
+
+    # Afficher le tableau des pourcentages
+    st.markdown("### Pourcentage de créances contentieuses parmi les créances significatives par année")
+    st.write(creances_par_annee)
+
+    # Créer un graphique en ligne pour montrer l'évolution du pourcentage au fil des années
+    fig_line = donnees.figure("app_cont/line", generate_pourcentage_chart, creances_par_annee, snap=snap)
+
+    # Afficher le graphique en ligne
+    st.plotly_chart(fig_line)
 
     # Obtenir la liste unique des années
     years = df_cont['annee'].unique()
@@ -229,15 +271,91 @@ def main():
             #st.write("### Diagramme en Radar")
             container = st.container()
             with container:
-                radar_chart = generate_cont_radar_chart(year)
+                radar_chart = donnees.figure(f"app_cont/radar/{year}", generate_cont_radar_chart, df_cont, year, snap=snap)
                 st.plotly_chart(radar_chart)
 
         with col2:
             #st.write("### Cartographie du risque de créances contentieuses")
             container = st.container()
             with container:
-                scatter_plot = generate_cont_scatter_plot(year)
+                scatter_plot = donnees.figure(f"app_cont/scatter/{year}", generate_cont_scatter_plot, df_cont, year, snap=snap)
                 st.plotly_chart(scatter_plot)
 
+    # Détail des créances au niveau contrat, servi page par page depuis la base locale
+    st.header("Détail des créances contentieuses par contrat")
+    col1, col2 = st.columns(2)
+    with col1:
+        contrat_year = st.selectbox("Année", sorted(years), key="contrats_year_cont")
+    with col2:
+        contrat_dr = st.selectbox("Direction Régionale (DR)", sorted(df_cont['NOM_DR'].unique()), key="contrats_dr_cont")
+
+    filtres = {"annee": contrat_year, "NOM_DR": contrat_dr, "contentieux": 1}
+    con = contrats_store.open_store()
+    if con is not None and "contentieux" not in contrats_store.list_columns(con):
+        # Base construite avant que la colonne soit obligatoire : ne pas lister toutes les créances
+        st.warning("La base des contrats n'indique pas les créances contentieuses : reconstruisez-la avec contrats_store.py.")
+    else:
+        if con is not None:
+            # Les noms de DR du contentieux sont sans espaces ("ALGER1") : retrouver le nom de la base
+            noms_dr = {nom.replace(" ", ""): nom for nom in contrats_store.store_values("NOM_DR")}
+            filtres["NOM_DR"] = noms_dr.get(contrat_dr, contrat_dr)
+        contrats_store.render_contract_table(filtres, key="contrats_cont")
+
+    # Modèle de Markov : transitions annuelles entre états des créances, par DR
+    st.header("Transitions entre états des créances par DR")
+    raw_mtime = os.path.getmtime(markov_cont.RAW_CONTRATS) if os.path.exists(markov_cont.RAW_CONTRATS) else None
+    annees_markov, drs_markov, stocks, matrices, source = fit_transitions(df_creance_info, df_cont, raw_mtime)
+    if source == "contrats":
+        st.markdown("Les probabilités de transition sont comptées contrat par contrat sur les données brutes.")
+    else:
+        st.markdown("Faute de suivi individuel des contrats, les probabilités de transition sont estimées à partir des effectifs annuels de chaque état (hypothèse de flux minimaux).")
+        exclues = sorted(set(markov_cont.dr_key(df_creance_info["NOM_DR"])) - set(drs_markov))
+        if exclues:
+            st.caption(f"DR absentes de la base contentieux, non modélisées : {', '.join(exclues)}")
+
+    # Probabilité de passage des créances significatives au contentieux, pour toutes les DR
+    df_passage = pd.DataFrame({
+        "DR": drs_markov,
+        "Significative → contentieux": matrices[:, markov_cont.S, markov_cont.C],
+        "Significative → clôturée": matrices[:, markov_cont.S, markov_cont.F],
+        "Contentieux → clôturée": matrices[:, markov_cont.C, markov_cont.F],
+    }).sort_values(by="Significative → contentieux", ascending=False)
+    st.write(df_passage)
+
+    selected_dr_markov = st.selectbox("Direction Régionale (DR)", drs_markov, key="markov_dr")
+    i_dr = drs_markov.index(selected_dr_markov)
+    horizon = st.slider("Horizon de projection (années)", 1, 10, 5)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fig_matrice = px.imshow(
+            matrices[i_dr],
+            x=markov_cont.ETATS,
+            y=markov_cont.ETATS,
+            labels=dict(x="État l'année suivante", y="État", color="Probabilité"),
+            title=f"Matrice de transition annuelle - {selected_dr_markov}",
+            color_continuous_scale="Blues",
+            zmin=0,
+            zmax=1,
+            text_auto=".2f"
+        )
+        st.plotly_chart(fig_matrice)
+
+    with col2:
+        # Projection à partir des effectifs de la dernière année observée
+        etat_initial = np.nan_to_num(np.concatenate([stocks[-1], np.zeros((len(drs_markov), 1))], axis=1))
+        projection = markov_cont.project(matrices, etat_initial, horizon)[i_dr]
+        df_projection = pd.DataFrame(projection, columns=markov_cont.ETATS)
+        df_projection["Année"] = annees_markov[-1] + np.arange(horizon + 1)
+        fig_projection = px.line(
+            df_projection,
+            x="Année",
+            y=markov_cont.ETATS[1:3],
+            markers=True,
+            title=f"Projection des créances significatives et contentieuses - {selected_dr_markov}",
+            labels={"value": "Nombre de créances", "variable": "État"}
+        )
+        st.plotly_chart(fig_projection)
+
 if __name__ == "__main__":
     main()
@@ -5,33 +5,28 @@ import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 import plotly.express as px
 
-def main():
-    # Configurer la page pour utiliser toute la largeur
-    st.set_page_config(layout="wide")
-    st.title("Analyse des Créances significatives par Direction Régionale (DR)")
-    st.markdown("Cette section permet de visualiser les créances significatives par Direction Régionale (DR) et d'analyser les risques associés en nombre et en montant moyen.")
-    # Charger les données localement
-    @st.cache_data
-    def load_data_dr():
-        df_dr = pd.read_excel("proba_bayesienne_DR.xlsx")
-        return df_dr
+import carto
+import donnees
+import contrats_store
+import sensibilite
 
-    @st.cache_data
-    def load_data_br():
-        excel_file = "base_creance_branche_finale.xlsx"
-        df_br = pd.read_excel(excel_file)
-        return df_br
+# Charger les données localement
+def load_data_dr(snap=None):
+    df_dr = donnees.load("proba_bayesienne_DR.xlsx", snap)
+    return df_dr
 
-    @st.cache_data
-    def load_data_creance_info():
-        df = pd.read_excel("base_creance_info_v3.xlsx")
-        df = df[["annee", "NOM_DR", "CODE_DR", "BRANCHE", "proba_a_priori", "nb_contrats_gt1000", "total_contrats", "moyenne_creances_gt1000"]]
-        return df
+def load_data_br(snap=None):
+    excel_file = "base_creance_branche_finale.xlsx"
+    df_br = donnees.load(excel_file, snap)
+    return df_br
 
-    df_dr = load_data_dr()
-    df_br = load_data_br()
-    df_creance_info = load_data_creance_info()
+def load_data_creance_info(snap=None):
+    df = donnees.load("base_creance_info_v3.xlsx", snap)
+    df = df[["annee", "NOM_DR", "CODE_DR", "BRANCHE", "proba_a_priori", "nb_contrats_gt1000", "total_contrats", "moyenne_creances_gt1000"]]
+    return df
 
+
+def generate_line_chart(df_dr):
     # Créer le graphique
     fig_line = px.line(
         df_dr,
@@ -41,18 +36,9 @@ def main():
         title="Évolution de la probabilité bayésienne par DR au fil du temps",
         labels={"annee": "Année", "proba_bayesienne": "Probabilité Bayésienne", "NOM_DR": "Direction Régionale"}
     )
+    return fig_line
 
-    # Afficher le graphique dans Streamlit
-    st.plotly_chart(fig_line, use_container_width=True)
-
-    # Top 3 DR par année
-    st.markdown("### Classement des 3 premieres DR par année en terme de risque de créance significative")
-    df_sorted=df_dr[["annee", "NOM_DR", "proba_bayesienne"]].copy()
-    df_sorted = df_dr.sort_values(by=["annee", "proba_bayesienne"], ascending=[True, False])
-    df_sorted.rename(columns={"proba_bayesienne": "risque creance significative"}, inplace=True)
-    top_3_per_year = df_sorted.groupby("annee").head(3)
-    st.write(top_3_per_year[["annee", "NOM_DR", "risque creance significative"]])
-
+def aggregate_creance_info(df_creance_info):
     # Définir les colonnes et les opérations d'agrégation
     aggregation_rules = {
         'CODE_DR': 'mean',
@@ -64,173 +50,247 @@ def main():
 
     # Agréger le DataFrame
     df_aggregated = df_creance_info.groupby(['annee', 'NOM_DR']).agg(aggregation_rules).reset_index()
+    return df_aggregated
 
-    # Dictionnaire des abréviations pour les DR
-    abbreviations = {
-        "ALGER 1": "ALG1",
-        "ALGER 2": "ALG2",
-        "ALGER 3": "ALG3",
-        "ANNABA": "ANN",
-        "BATNA": "BAT",
-        "BECHAR": "BEC",
-        "BLIDA": "BLI",
-        "CONSTANTINE": "CON",
-        "CORPORATE": "COR",
-        "ORAN": "ORA",
-        "OUARGLA": "OUA",
-        "RELIZANE": "REL",
-        "SBA": "SBA",
-        "SETIF": "SET",
-        "TIZI OUZOU": "TIZ",
-        "TLEMCEN": "TLE"
-    }
+# Dictionnaire des abréviations pour les DR
+abbreviations = {
+    "ALGER 1": "ALG1",
+    "ALGER 2": "ALG2",
+    "ALGER 3": "ALG3",
+    "ANNABA": "ANN",
+    "BATNA": "BAT",
+    "BECHAR": "BEC",
+    "BLIDA": "BLI",
+    "CONSTANTINE": "CON",
+    "CORPORATE": "COR",
+    "ORAN": "ORA",
+    "OUARGLA": "OUA",
+    "RELIZANE": "REL",
+    "SBA": "SBA",
+    "SETIF": "SET",
+    "TIZI OUZOU": "TIZ",
+    "TLEMCEN": "TLE"
+}
 
-    # Fonction pour générer les images
-    def generate_radar_chart(year):
-        data = df_dr[df_dr['annee'] == year]
-        fig = go.Figure()
-        fig.add_trace(go.Scatterpolar(
-            r=data['proba_bayesienne'],
-            theta=data['NOM_DR'],
-            name=str(year),
-            fill='toself'
-        ))
-        fig.update_layout(
-            polar=dict(radialaxis=dict(visible=True)),
-            title=dict(
-                text=f"Diagramme en radar des probabilités bayésiennes par DR - {year}",
-                x=0.5,  # Centrer le titre
-                y=0.95,  # Position verticale (proche du haut)
-                xanchor="center",  # Ancrage horizontal
-                yanchor="top",  # Ancrage vertical
-                font=dict(color="black")  # Couleur et style du texte
-            ),
-            height=400,
-            width=700,
-        )
-        return fig
-
-    def generate_scatter_plot(year):
-        df_filtered = df_aggregated[df_aggregated['annee'] == year].copy()
-
-        if (year == 2021):
-            df_filtered['moyenne_creances_gt1000'] = np.log(df_filtered['moyenne_creances_gt1000'])
-            yaxis_title = "Logarithme du montant moyen des créances significatives"
-        else:
-            yaxis_title = "Montant moyen des créances significatives"
-
-        df_filtered['NOM_DR'] = df_filtered['NOM_DR'].map(abbreviations)
-
-        mean_nb_contrats = df_filtered['nb_contrats_gt1000'].mean()
-        mean_moyenne_creances = df_filtered['moyenne_creances_gt1000'].mean()
-
-        # Créer une grille pour le dégradé de couleur
-        x = np.linspace(df_filtered['nb_contrats_gt1000'].min(), df_filtered['nb_contrats_gt1000'].max(), 100)
-        y = np.linspace(df_filtered['moyenne_creances_gt1000'].min(), df_filtered['moyenne_creances_gt1000'].max(), 100)
-        X, Y = np.meshgrid(x, y)
-
-        # Calculer la probabilité bayésienne comme une fonction de X et Y (exemple simplifié)
-        Z = (X - X.min()) / (X.max() - X.min()) * (Y - Y.min()) / (Y.max() - Y.min())  # Normalisation dynamique  # Normalisation pour créer un dégradé
-
-        # Créer la figure
-        fig = go.Figure()
-
-        # Ajouter le dégradé de couleur en arrière-plan
-        fig.add_trace(go.Contour(
-            x=x,
-            y=y,
-            z=Z,
-            colorscale=[
-            [0, "#baf5bd"],  # Vert clair
-            [0.02, "#c8f5b3"],  # Vert-jaune clair
-            [0.08, "#eff595"],  # Jaune
-            [0.35, "#f5e88b"],  # Jaune-orange clair
-            [0.42, "#f5d97f"],  # Orange clair
-            [0.49, "#f5ca73"],  # Orange
-            # [0.56, "#f5bb67"],  # Orange-rouge clair
-            # [0.63, "#f5ac5b"],  # Orange-rouge
-            # [0.7, "#f57c42"],  # Rouge-orange
-            [0.77, "#f55c36"],  # Rouge clair
-            [0.84, "#f53c2a"],  # Rouge moyen
-            [0.91, "#f51c1e"],  # Rouge foncé
-            [1, "#f50012"]  # Rouge intense
-            ],  # Dégradé de vert à rouge
-            ncontours=50,
-            showscale=True,
-            colorbar=dict(title="barre du risque",
-                          tickfont=dict(size=10),
-                          len=0.4,
-                          x=1.05,
-                          xanchor="right",
-                          y=-0.5,
-                          yanchor="bottom"
-                          ),    # afficher la barre de couleur
-            opacity=0.4       # Rendre le dégradé semi-transparent
-        ))
-
-        # Ajouter les points représentant les DR
-        fig.add_trace(go.Scatter(
-            x=df_filtered['nb_contrats_gt1000'],
-            y=df_filtered['moyenne_creances_gt1000'],
-            mode='markers+text',
-            text=df_filtered['NOM_DR'],
-            textposition='top center',
-            name="DR",
-            marker=dict(size=8, color='blue')
-        ))
-
-        # Ajouter une ligne verticale (moyenne nb_contrats_gt1000)
-        fig.add_trace(go.Scatter(
-            x=[mean_nb_contrats, mean_nb_contrats],
-            y=[df_filtered['moyenne_creances_gt1000'].min(), df_filtered['moyenne_creances_gt1000'].max()],
-            mode='lines',
-            line=dict(color='red', dash='dot'),
-            name="Moyenne des nombre de créances significatives"
-        ))
-
-        # Ajouter une ligne horizontale (moyenne moyenne_creances_gt1000)
-        fig.add_trace(go.Scatter(
-            x=[df_filtered['nb_contrats_gt1000'].min(), df_filtered['nb_contrats_gt1000'].max()],
-            y=[mean_moyenne_creances, mean_moyenne_creances],
-            mode='lines',
-            line=dict(color='blue', dash='dot'),
-            name="Montant moyen des créances"
-        ))
-
-        # Mettre à jour la mise en page
-        fig.update_layout(
-            title=dict(
-                text=f"Répartition du risque de créance signif des DR pour l'année\n {year}",
-                x=0.5,  # Position horizontale (centré)
-                y=0.95,  # Position verticale (proche du haut)
-                xanchor="center",  # Ancrage horizontal
+# Fonction pour générer les images
+def generate_radar_chart(df_dr, year):
+    data = df_dr[df_dr['annee'] == year]
+    fig = go.Figure()
+    fig.add_trace(go.Scatterpolar(
+        r=data['proba_bayesienne'],
+        theta=data['NOM_DR'],
+        name=str(year),
+        fill='toself'
+    ))
+    fig.update_layout(
+        polar=dict(radialaxis=dict(visible=True)),
+        title=dict(
+            text=f"Diagramme en radar des probabilités bayésiennes par DR - {year}",
+            x=0.5,  # Centrer le titre
+            y=0.95,  # Position verticale (proche du haut)
+            xanchor="center",  # Ancrage horizontal
             yanchor="top",  # Ancrage vertical
             font=dict(color="black")  # Couleur et style du texte
-            ),
-            xaxis_title="Nombre de créances significatives",
-            yaxis_title=yaxis_title,
-            template="plotly_white",
-            font=dict(color="black"),
-            title_font=dict(color="black"),
-            legend=dict(
-                yanchor="top",
-                y=-0.3,
-                xanchor="center",
-                x=0.5
-            ),
-            xaxis=dict(
-                tickfont=dict(color="black"),
-                title=dict(font=dict(color="black")),
-                showgrid=False  # Supprimer la grille de l'axe X
-            ),
-            yaxis=dict(
-                tickfont=dict(color="black"),
-                title=dict(font=dict(color="black")),
-                showgrid=False  # Supprimer la grille de l'axe Y
-            )
+        ),
+        height=400,
+        width=700,
+    )
+    return fig
+
+def generate_scatter_plot(df_aggregated, year):
+    df_filtered = df_aggregated[df_aggregated['annee'] == year].copy()
+
+    if (year == 2021):
+        df_filtered['moyenne_creances_gt1000'] = np.log(df_filtered['moyenne_creances_gt1000'])
+        yaxis_title = "Logarithme du montant moyen des créances significatives"
+    else:
+        yaxis_title = "Montant moyen des créances significatives"
+
+    df_filtered['NOM_DR'] = df_filtered['NOM_DR'].map(abbreviations)
+
+    mean_nb_contrats = df_filtered['nb_contrats_gt1000'].mean()
+    mean_moyenne_creances = df_filtered['moyenne_creances_gt1000'].mean()
+
+    # Créer une grille pour le dégradé de couleur
+    x = np.linspace(df_filtered['nb_contrats_gt1000'].min(), df_filtered['nb_contrats_gt1000'].max(), 100)
+    y = np.linspace(df_filtered['moyenne_creances_gt1000'].min(), df_filtered['moyenne_creances_gt1000'].max(), 100)
+    X, Y = np.meshgrid(x, y)
+
+    # Calculer la probabilité bayésienne comme une fonction de X et Y (exemple simplifié)
+    Z = (X - X.min()) / (X.max() - X.min()) * (Y - Y.min()) / (Y.max() - Y.min())  # Normalisation dynamique  # Normalisation pour créer un dégradé
+
+    # Créer la figure
+    fig = go.Figure()
+
+    # Ajouter le dégradé de couleur en arrière-plan
+    fig.add_trace(go.Contour(
+        x=x,
+        y=y,
+        z=Z,
+        colorscale=[
+        [0, "#baf5bd"],  # Vert clair
+        [0.02, "#c8f5b3"],  # Vert-jaune clair
+        [0.08, "#eff595"],  # Jaune
+        [0.35, "#f5e88b"],  # Jaune-orange clair
+        [0.42, "#f5d97f"],  # Orange clair
+        [0.49, "#f5ca73"],  # Orange
+        # [0.56, "#f5bb67"],  # Orange-rouge clair
+        # [0.63, "#f5ac5b"],  # Orange-rouge
+        # [0.7, "#f57c42"],  # Rouge-orange
+        [0.77, "#f55c36"],  # Rouge clair
+        [0.84, "#f53c2a"],  # Rouge moyen
+        [0.91, "#f51c1e"],  # Rouge foncé
+        [1, "#f50012"]  # Rouge intense
+        ],  # Dégradé de vert à rouge
+        ncontours=50,
+        showscale=True,
+        colorbar=dict(title="barre du risque",
+                      tickfont=dict(size=10),
+                      len=0.4,
+                      x=1.05,
+                      xanchor="right",
+                      y=-0.5,
+                      yanchor="bottom"
+                      ),    # afficher la barre de couleur
+        opacity=0.4       # Rendre le dégradé semi-transparent
+    ))
+
+    # Ajouter les points représentant les DR
+    fig.add_trace(go.Scatter(
+        x=df_filtered['nb_contrats_gt1000'],
+        y=df_filtered['moyenne_creances_gt1000'],
+        mode='markers+text',
+        text=df_filtered['NOM_DR'],
+        textposition='top center',
+        name="DR",
+        marker=dict(size=8, color='blue')
+    ))
+
+    # Ajouter une ligne verticale (moyenne nb_contrats_gt1000)
+    fig.add_trace(go.Scatter(
+        x=[mean_nb_contrats, mean_nb_contrats],
+        y=[df_filtered['moyenne_creances_gt1000'].min(), df_filtered['moyenne_creances_gt1000'].max()],
+        mode='lines',
+        line=dict(color='red', dash='dot'),
+        name="Moyenne des nombre de créances significatives"
+    ))
+
+    # Ajouter une ligne horizontale (moyenne moyenne_creances_gt1000)
+    fig.add_trace(go.Scatter(
+        x=[df_filtered['nb_contrats_gt1000'].min(), df_filtered['nb_contrats_gt1000'].max()],
+        y=[mean_moyenne_creances, mean_moyenne_creances],
+        mode='lines',
+        line=dict(color='blue', dash='dot'),
+        name="Montant moyen des créances"
+    ))
+
+    # Mettre à jour la mise en page
+    fig.update_layout(
+        title=dict(
+            text=f"Répartition du risque de créance signif des DR pour l'année\n {year}",
+            x=0.5,  # Position horizontale (centré)
+            y=0.95,  # Position verticale (proche du haut)
+            xanchor="center",  # Ancrage horizontal
+        yanchor="top",  # Ancrage vertical
+        font=dict(color="black")  # Couleur et style du texte
+        ),
+        xaxis_title="Nombre de créances significatives",
+        yaxis_title=yaxis_title,
+        template="plotly_white",
+        font=dict(color="black"),
+        title_font=dict(color="black"),
+        legend=dict(
+            yanchor="top",
+            y=-0.3,
+            xanchor="center",
+            x=0.5
+        ),
+        xaxis=dict(
+            tickfont=dict(color="black"),
+            title=dict(font=dict(color="black")),
+            showgrid=False  # Supprimer la grille de l'axe X
+        ),
+        yaxis=dict(
+            tickfont=dict(color="black"),
+            title=dict(font=dict(color="black")),
+            showgrid=False  # Supprimer la grille de l'axe Y
         )
+    )
+
+    return fig
+
 
-        return fig    
+def prebuild():
+    """Agrégats et figures de la page, indépendants des choix de l'utilisateur, pour le bundle."""
+    snap = donnees.snapshot()
+    df_dr = load_data_dr(snap)
+    df_aggregated = aggregate_creance_info(load_data_creance_info(snap))
+
+    figures = {"app_dr/line": generate_line_chart(df_dr)}
+    for year in df_dr['annee'].unique():
+        figures[f"app_dr/radar/{year}"] = generate_radar_chart(df_dr, year)
+        figures[f"app_dr/scatter/{year}"] = generate_scatter_plot(df_aggregated, year)
+    return {"tables": {"app_dr/aggregated": df_aggregated}, "figures": figures}
+
+def main():
+    # Un seul instantané des données pour toute l'exécution de la page
+    snap = donnees.snapshot()
+
+    # Configurer la page pour utiliser toute la largeur
+    st.set_page_config(layout="wide")
+    st.title("Analyse des Créances significatives par Direction Régionale (DR)")
+    st.markdown("Cette section permet de visualiser les créances significatives par Direction Régionale (DR) et d'analyser les risques associés en nombre et en montant moyen.")
+    df_dr = load_data_dr(snap)
+    df_br = load_data_br(snap)
+    df_creance_info = load_data_creance_info(snap)
+    df_aggregated = donnees.table("app_dr/aggregated", aggregate_creance_info, df_creance_info, snap=snap)
+
+    # Créer le graphique
+    fig_line = donnees.figure("app_dr/line", generate_line_chart, df_dr, snap=snap)
+
+    # Afficher le graphique dans Streamlit
+    st.plotly_chart(fig_line, use_container_width=True)
+
+    # Top 3 DR par année
+    st.markdown("### Classement des 3 premieres DR par année en terme de risque de créance significative")
+    df_sorted=df_dr[["annee", "NOM_DR", "proba_bayesienne"]].copy()
+    df_sorted = df_dr.sort_values(by=["annee", "proba_bayesienne"], ascending=[True, False])
+    df_sorted.rename(columns={"proba_bayesienne": "risque creance significative"}, inplace=True)
+    top_3_per_year = df_sorted.groupby("annee").head(3)
+    st.write(top_3_per_year[["annee", "NOM_DR", "risque creance significative"]])
+
+    # Robustesse du classement au choix de l'a priori
+    st.markdown("### Robustesse du classement au choix de la probabilité a priori")
+    st.markdown("Les taux de créances significatives sont lissés vers une moyenne a priori commune (moyenne nationale × facteur), avec une force exprimée en nombre de contrats fictifs. La fréquence indique la part des combinaisons de la grille où la DR reste dans le top 3.")
+
+    @st.cache_data
+    def compute_rank_stability(df_creance_info, facteur_min, facteur_max, force_max):
+        facteurs = np.linspace(facteur_min, facteur_max, 15)
+        forces = np.concatenate([[0], np.logspace(0, np.log10(force_max), 20)])
+        df_stabilite = sensibilite.rank_stability(df_creance_info, facteurs, forces)
+        return df_stabilite
+
+    col1, col2 = st.columns(2)
+    with col1:
+        facteur_min, facteur_max = st.slider("Facteur appliqué à la moyenne a priori nationale", 0.1, 5.0, (0.5, 2.0), 0.1)
+    with col2:
+        force_max = st.select_slider("Force maximale de l'a priori (contrats fictifs)", [100, 1_000, 10_000, 100_000], value=10_000)
+
+    df_stabilite = compute_rank_stability(df_creance_info, facteur_min, facteur_max, force_max)
+    fig_stabilite = px.imshow(
+        df_stabilite.pivot(index="NOM_DR", columns="annee", values="frequence_top3"),
+        labels=dict(x="Année", y="Direction Régionale (DR)", color="Fréquence top 3"),
+        title="Fréquence de présence dans le top 3 selon l'a priori",
+        color_continuous_scale="Blues",
+        zmin=0,
+        zmax=1,
+        text_auto=".0%"
+    )
+    st.plotly_chart(fig_stabilite, use_container_width=True)
+
+    # Rappeler la stabilité des DR du classement observé
+    top_3_stabilite = df_stabilite[df_stabilite["rang_observe"] <= 3].sort_values(by=["annee", "rang_observe"])
+    st.write(top_3_stabilite[["annee", "NOM_DR", "rang_observe", "frequence_top3", "rang_min", "rang_max"]])
 
     # Obtenir la liste unique des années
     years = df_dr['annee'].unique()
@@ -245,15 +305,57 @@ def main():
             #st.write("### Diagramme en radar")
             container = st.container()
             with container:
-                radar_chart = generate_radar_chart(year)
+                radar_chart = donnees.figure(f"app_dr/radar/{year}", generate_radar_chart, df_dr, year, snap=snap)
                 st.plotly_chart(radar_chart)
 
         with col2:
             #st.write("### Cartographie du risque de créance significative")
             container = st.container()
             with container:
-                scatter_plot = generate_scatter_plot(year)
+                scatter_plot = donnees.figure(f"app_dr/scatter/{year}", generate_scatter_plot, df_aggregated, year, snap=snap)
                 st.plotly_chart(scatter_plot)
 
+    # Mode détaillé : cartographie au niveau DR × branche en rendu WebGL
+    st.header("Cartographie détaillée du risque")
+    drill_down = st.toggle("Activer le mode détaillé (DR × branche)")
+    if drill_down:
+        df_points = df_creance_info.copy()
+        df_points['label'] = df_points['NOM_DR'].map(abbreviations) + " / " + df_points['BRANCHE']
+
+        selected_year = st.selectbox("Année", sorted(years), key="drilldown_year")
+        df_year = df_points[df_points['annee'] == selected_year]
+
+        # Fenêtre de visualisation : seuls les points visibles sont envoyés au navigateur
+        x_min, x_max = float(df_year['nb_contrats_gt1000'].min()), float(df_year['nb_contrats_gt1000'].max())
+        y_min, y_max = float(df_year['moyenne_creances_gt1000'].min()), float(df_year['moyenne_creances_gt1000'].max())
+        col1, col2 = st.columns(2)
+        with col1:
+            x_range = st.slider("Nombre de créances significatives", x_min, max(x_max, x_min + 1), (x_min, max(x_max, x_min + 1)))
+        with col2:
+            y_range = st.slider("Montant moyen des créances significatives", y_min, max(y_max, y_min + 1), (y_min, max(y_max, y_min + 1)))
+
+        df_reduced = carto.reduce_points(df_year, 'nb_contrats_gt1000', 'moyenne_creances_gt1000', 'label', x_range, y_range)
+        st.caption(f"{len(df_reduced)} points affichés pour {int(df_reduced['effectif'].sum())} points visibles")
+        drilldown_plot = carto.generate_drilldown_plot(
+            df_reduced,
+            title=f"Répartition détaillée du risque de créance signif pour l'année {selected_year}",
+            xaxis_title="Nombre de créances significatives",
+            yaxis_title="Montant moyen des créances significatives"
+        )
+        st.plotly_chart(drilldown_plot, use_container_width=True)
+
+    # Détail des créances au niveau contrat, servi page par page depuis la base locale
+    st.header("Détail des créances par contrat")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        contrat_year = st.selectbox("Année", sorted(years), key="contrats_year")
+    with col2:
+        contrat_dr = st.selectbox("Direction Régionale (DR)", sorted(df_dr['NOM_DR'].unique()), key="contrats_dr")
+    with col3:
+        contrat_branche = st.selectbox("Branche", ["Toutes"] + sorted(df_creance_info['BRANCHE'].unique()), key="contrats_branche")
+
+    filtres = {"annee": contrat_year, "NOM_DR": contrat_dr, "BRANCHE": None if contrat_branche == "Toutes" else contrat_branche}
+    contrats_store.render_contract_table(filtres, key="contrats_dr")
+
 if __name__ == "__main__":
     main()
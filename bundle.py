@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from pipeline import FICHIER_BRANCHE, FICHIER_CONT, FICHIER_DR, FICHIER_DR_V2, FICHIER_INFO, content_hash
+
+# Répertoire des bundles : un sous-répertoire par version, CURRENT désigne la version servie
+BUNDLE_DIR = "bundle"
+CURRENT_FILE = os.path.join(BUNDLE_DIR, "CURRENT")
+FORMAT_VERSION = 1
+
+# Nombre de versions conservées en plus de la version courante
+KEEP_VERSIONS = 1
+
+SOURCES = [FICHIER_DR, FICHIER_BRANCHE, FICHIER_INFO, FICHIER_CONT, FICHIER_DR_V2]
+
+# Modules dont le code détermine le contenu du bundle (agrégats et figures)
+PAGES = ["eda", "app_dr", "app_branche", "app_cont"]
+CODE_FILES = [module + ".py" for module in PAGES + ["bundle", "donnees"]]
+
+
+@lru_cache(maxsize=64)
+def _cached_hash(path, mtime_ns, size):
+    return content_hash(path)
+
+
+def source_hash(path):
+    """Empreinte d'un fichier, recalculée seulement si sa date ou sa taille change."""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return _cached_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+def is_current(manifest):
+    """Vrai si le bundle correspond aux classeurs et au code des pages actuels."""
+    return manifest["version"] == bundle_version(SOURCES)
+
+
+def bundle_version(sources):
+    """Version déterminée par le contenu des classeurs et le code des pages."""
+    digest = hashlib.sha256(f"format={FORMAT_VERSION}".encode())
+    for path in sources:
+        digest.update(f"{path}={source_hash(path)}".encode())
+    for path in CODE_FILES:
+        digest.update(f"{path[:-3]}={source_hash(path)}".encode())
+    return digest.hexdigest()[:12]
+
+
+def write_dataset(path, df):
+    """Écrit un DataFrame colonne par colonne en fichiers .npy ; retourne ses métadonnées.
+
+    Les colonnes numériques sont projetables en mémoire à la lecture ; les colonnes
+    texte sont stockées sous forme de codes entiers et de catégories.
+    """
+    os.makedirs(path)
+    columns = []
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if values.dtype.kind in "iufb":
+            np.save(os.path.join(path, f"{i}.npy"), values.to_numpy())
+            columns.append({"name": column, "kind": "numeric"})
+        else:
+            codes, categories = pd.factorize(values)
+            np.save(os.path.join(path, f"{i}.npy"), codes.astype(np.int32))
+            columns.append({"name": column, "kind": "category", "categories": [str(c) for c in categories]})
+    return {"rows": len(df), "columns": columns}
+
+
+def open_dataset(path, meta):
+    data = {}
+    for i, column in enumerate(meta["columns"]):
+        values = np.load(os.path.join(path, f"{i}.npy"), mmap_mode="r")
+        if column["kind"] == "category":
+            categories = np.array(column["categories"] + [None], dtype=object)
+            # Le code -1 (valeur manquante) pointe sur le None final
+            values = categories[values]
+        data[column["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def dataset_dir(name):
+    return name.replace("/", "__")
+
+
+def figure_file(key):
+    return key.replace("/", "__") + ".json"
+
+
+def current_version():
+    if not os.path.exists(CURRENT_FILE):
+        return None
+    with open(CURRENT_FILE) as f:
+        version = f.read().strip()
+    return version if os.path.isdir(os.path.join(BUNDLE_DIR, version)) else None
+
+
+def open_bundle(version):
+    """Ouvre un bundle : manifeste et jeux de données projetés en mémoire (les figures sont lues à la demande)."""
+    path = os.path.join(BUNDLE_DIR, version)
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    datasets = {
+        name: open_dataset(os.path.join(path, "data", dataset_dir(name)), meta)
+        for name, meta in manifest["datasets"].items()
+    }
+    return {"manifest": manifest, "path": path, "datasets": datasets}
+
+
+def read_figure(version, key):
+    with open(os.path.join(BUNDLE_DIR, version, "figures", figure_file(key))) as f:
+        return f.read()
+
+
+def build(force=False):
+    """Construit le bundle des classeurs, agrégats et figures de toutes les pages.
+
+    Le bundle est écrit dans un répertoire temporaire puis publié en remplaçant
+    CURRENT, de sorte qu'un lecteur ne voit jamais un bundle incomplet.
+    Retourne la version publiée.
+    """
+    import eda
+    import app_dr
+    import app_branche
+    import app_cont
+
+    version = bundle_version(SOURCES)
+    path = os.path.join(BUNDLE_DIR, version)
+    if os.path.isdir(path) and not force:
+        _publish(version)
+        return version
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(os.path.join(tmp_path, "figures"))
+
+    manifest = {
+        "version": version,
+        "format": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sources": {source: source_hash(source) for source in SOURCES},
+        "datasets": {},
+        "figures": [],
+    }
+
+    for source in SOURCES:
+        manifest["datasets"][source] = write_dataset(os.path.join(tmp_path, "data", dataset_dir(source)), pd.read_excel(source))
+
+    for page in [eda, app_dr, app_branche, app_cont]:
+        prebuilt = page.prebuild()
+        for key, df in prebuilt["tables"].items():
+            manifest["datasets"][key] = write_dataset(os.path.join(tmp_path, "data", dataset_dir(key)), df)
+        for key, fig in prebuilt["figures"].items():
+            with open(os.path.join(tmp_path, "figures", figure_file(key)), "w") as f:
+                f.write(fig.to_json())
+            manifest["figures"].append(key)
+
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    _publish(version)
+    return version
+
+
+def _publish(version):
+    tmp_current = CURRENT_FILE + ".tmp"
+    with open(tmp_current, "w") as f:
+        f.write(version)
+    os.replace(tmp_current, CURRENT_FILE)
+
+    # Supprimer les versions les plus anciennes
+    versions = [v for v in os.listdir(BUNDLE_DIR) if os.path.isdir(os.path.join(BUNDLE_DIR, v)) and v != version and not v.endswith(".tmp")]
+    versions.sort(key=lambda v: os.path.getmtime(os.path.join(BUNDLE_DIR, v)), reverse=True)
+    for old in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(os.path.join(BUNDLE_DIR, old))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit le bundle préconstruit servi au démarrage des réplicas.")
+    parser.add_argument("--force", action="store_true", help="Reconstruire même si la version existe déjà")
+    args = parser.parse_args()
+
+    debut = time.perf_counter()
+    version = build(force=args.force)
+    print(f"Bundle {version} publié dans {BUNDLE_DIR} ({time.perf_counter() - debut:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
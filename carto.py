@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Nombre maximal de points envoyés au navigateur en mode détaillé
+MAX_POINTS = 5000
+
+# Dégradé de vert à rouge des cartographies du risque
+COLORSCALE_RISQUE = [
+    [0, "#baf5bd"],  # Vert clair
+    [0.08, "#eff595"],  # Jaune
+    [0.42, "#f5d97f"],  # Orange clair
+    [0.77, "#f55c36"],  # Rouge clair
+    [1, "#f50012"]  # Rouge intense
+]
+
+
+def bin_points(x, y, n_bins):
+    """Regroupe les points sur une grille n_bins × n_bins.
+
+    Retourne (cx, cy, counts, representant) : centroïde, effectif et indice d'un point
+    représentatif (le premier rencontré) pour chaque case non vide.
+    """
+    def to_bin(v):
+        span = v.max() - v.min()
+        if span == 0:
+            return np.zeros(len(v), dtype=np.int64)
+        return np.clip(((v - v.min()) / span * n_bins).astype(np.int64), 0, n_bins - 1)
+
+    cells = to_bin(x) * n_bins + to_bin(y)
+    _, representant, inverse, counts = np.unique(cells, return_index=True, return_inverse=True, return_counts=True)
+    cx = np.bincount(inverse, weights=x) / counts
+    cy = np.bincount(inverse, weights=y) / counts
+    return cx, cy, counts, representant
+
+
+def reduce_points(df, x, y, label, x_range=None, y_range=None, max_points=MAX_POINTS):
+    """Réduit côté serveur les points visibles dans la fenêtre (x_range, y_range).
+
+    En dessous de max_points, les points sont renvoyés tels quels. Au-delà, ils sont
+    agrégés sur une grille ; l'effectif de chaque case est conservé, de sorte que la
+    somme des effectifs reste le nombre de points visibles.
+    Retourne un DataFrame (x, y, label, effectif).
+    """
+    xs = df[x].to_numpy(dtype=float)
+    ys = df[y].to_numpy(dtype=float)
+    labels = df[label].to_numpy()
+
+    # Fenêtre de visualisation
+    visible = np.isfinite(xs) & np.isfinite(ys)
+    if x_range is not None:
+        visible &= (xs >= x_range[0]) & (xs <= x_range[1])
+    if y_range is not None:
+        visible &= (ys >= y_range[0]) & (ys <= y_range[1])
+    xs, ys, labels = xs[visible], ys[visible], labels[visible]
+
+    if len(xs) <= max_points:
+        return pd.DataFrame({"x": xs, "y": ys, "label": labels, "effectif": np.ones(len(xs), dtype=np.int64)})
+
+    cx, cy, counts, representant = bin_points(xs, ys, int(np.sqrt(max_points)))
+    return pd.DataFrame({"x": cx, "y": cy, "label": labels[representant], "effectif": counts})
+
+
+def generate_drilldown_plot(df_points, title, xaxis_title, yaxis_title):
+    """Cartographie du risque en rendu WebGL (Scattergl) pour un grand nombre de points.
+
+    Les colonnes sont passées en tableaux numpy float32 : plotly les sérialise en
+    tableaux binaires (base64) plutôt qu'en listes JSON.
+    """
+    xs = df_points["x"].to_numpy(dtype=np.float32)
+    ys = df_points["y"].to_numpy(dtype=np.float32)
+    effectifs = df_points["effectif"].to_numpy(dtype=np.float32)
+
+    # Même normalisation du risque que le dégradé des cartographies par DR
+    def normalize(v):
+        span = v.max() - v.min() if len(v) else 0
+        return (v - v.min()) / span if span > 0 else np.zeros_like(v)
+
+    risque = normalize(xs) * normalize(ys)
+
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(
+        x=xs,
+        y=ys,
+        mode="markers",
+        text=df_points["label"].astype(str).to_numpy(),
+        customdata=effectifs,
+        hovertemplate="%{text}<br>x: %{x}<br>y: %{y}<br>Effectif: %{customdata}<extra></extra>",
+        marker=dict(
+            size=(4 + 2 * np.log1p(effectifs)).astype(np.float32),
+            color=risque.astype(np.float32),
+            colorscale=COLORSCALE_RISQUE,
+            showscale=True,
+            colorbar=dict(title="barre du risque", len=0.4),
+            opacity=0.8
+        ),
+        name="Points"
+    ))
+
+    fig.update_layout(
+        title=dict(text=title, y=0.95, font=dict(color="black")),
+        xaxis_title=xaxis_title,
+        yaxis_title=yaxis_title,
+        template="plotly_white",
+        font=dict(color="black"),
+        xaxis=dict(showgrid=False),
+        yaxis=dict(showgrid=False)
+    )
+
+    return fig
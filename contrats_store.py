@@ -0,0 +1,185 @@
+import argparse
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+import streamlit as st
+
+# Base locale des créances au niveau contrat
+DB_PATH = "contrats.sqlite"
+TABLE = "contrats"
+
+# Colonnes obligatoires du fichier source ; les autres colonnes sont conservées telles quelles
+REQUIRED_COLUMNS = ["annee", "NOM_DR", "BRANCHE", "montant", "contentieux"]
+
+PAGE_SIZES = [25, 50, 100, 200]
+
+# Connexions ouvertes par base : {db_path: {mtime: connexion}}
+_connections = {}
+_connections_lock = threading.Lock()
+KEEP_CONNECTIONS = 2
+
+
+def build_store(source, db_path=DB_PATH, chunksize=100_000):
+    """Importe un fichier de créances par contrat (CSV ou Excel) dans la base SQLite indexée.
+
+    La base existante est remplacée. Les CSV sont lus par blocs pour ne pas charger
+    tout le fichier en mémoire.
+    """
+    if source.endswith((".xlsx", ".xls")):
+        chunks = [pd.read_excel(source)]
+    else:
+        chunks = pd.read_csv(source, chunksize=chunksize)
+
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.execute("PRAGMA journal_mode=OFF")
+        con.execute("PRAGMA synchronous=OFF")
+        n_rows = 0
+        for chunk in chunks:
+            missing = [c for c in REQUIRED_COLUMNS if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Colonnes manquantes dans {source} : {missing}")
+            chunk.to_sql(TABLE, con, if_exists="append", index=False)
+            n_rows += len(chunk)
+
+        # Index composite : filtres d'égalité sur (annee, NOM_DR, BRANCHE) puis tri par montant
+        con.execute(f"CREATE INDEX idx_{TABLE}_cellule ON {TABLE} (annee, NOM_DR, BRANCHE, montant)")
+        con.execute(f"CREATE INDEX idx_{TABLE}_annee_montant ON {TABLE} (annee, montant)")
+        con.execute("ANALYZE")
+        con.commit()
+    finally:
+        con.close()
+
+    # Remplacement atomique : les lecteurs ne voient jamais une base à moitié construite
+    os.replace(tmp_path, db_path)
+    return n_rows
+
+
+def connect(db_path=DB_PATH):
+    """Ouvre la base en lecture seule, ou retourne None si elle n'existe pas."""
+    if not os.path.exists(db_path):
+        return None
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def list_columns(con):
+    return [row[1] for row in con.execute(f"PRAGMA table_info({TABLE})")]
+
+
+def list_values(con, column):
+    """Valeurs distinctes d'une colonne (servies par l'index pour annee)."""
+    if column not in list_columns(con):
+        raise ValueError(f"Colonne inconnue : {column}")
+    return [row[0] for row in con.execute(f'SELECT DISTINCT "{column}" FROM {TABLE} ORDER BY 1')]
+
+
+def _where(con, filtres):
+    # Les noms de colonnes sont validés contre le schéma, les valeurs passent en paramètres
+    columns = list_columns(con)
+    clauses, params = [], []
+    for column, value in filtres.items():
+        if value is None:
+            continue
+        if column not in columns:
+            raise ValueError(f"Colonne inconnue : {column}")
+        clauses.append(f'"{column}" = ?')
+        params.append(value.item() if hasattr(value, "item") else value)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+def count_rows(con, filtres):
+    where, params = _where(con, filtres)
+    return con.execute(f"SELECT COUNT(*) FROM {TABLE}{where}", params).fetchone()[0]
+
+
+def fetch_page(con, filtres, sort_by="montant", ascending=False, page=1, page_size=50):
+    """Retourne uniquement les lignes de la page demandée, triées côté base."""
+    if sort_by not in list_columns(con):
+        raise ValueError(f"Colonne de tri inconnue : {sort_by}")
+    where, params = _where(con, filtres)
+    order = "ASC" if ascending else "DESC"
+    query = f'SELECT * FROM {TABLE}{where} ORDER BY "{sort_by}" {order} LIMIT ? OFFSET ?'
+    return pd.read_sql_query(query, con, params=params + [page_size, (page - 1) * page_size])
+
+
+def get_connection(db_path=DB_PATH, mtime=None):
+    """Connexion partagée par base et par date de construction.
+
+    Une base reconstruite ouvre une nouvelle connexion ; la précédente reste ouverte
+    pour les exécutions en cours et les plus anciennes sont fermées.
+    """
+    with _connections_lock:
+        connexions = _connections.setdefault(db_path, {})
+        if mtime not in connexions:
+            connexions[mtime] = connect(db_path)
+            for ancienne in list(connexions)[:-KEEP_CONNECTIONS]:
+                connexions.pop(ancienne).close()
+        return connexions[mtime]
+
+
+def open_store(db_path=DB_PATH):
+    """Connexion partagée entre les sessions, ou None si la base n'a pas été construite."""
+    if not os.path.exists(db_path):
+        return None
+    return get_connection(db_path, os.path.getmtime(db_path))
+
+
+@st.cache_data
+def _store_values(db_path, mtime, column):
+    return list_values(get_connection(db_path, mtime), column)
+
+
+def store_values(column, db_path=DB_PATH):
+    """Valeurs distinctes d'une colonne, mises en cache jusqu'à la reconstruction de la base."""
+    if not os.path.exists(db_path):
+        return []
+    return _store_values(db_path, os.path.getmtime(db_path), column)
+
+
+def render_contract_table(filtres, key, db_path=DB_PATH):
+    """Affiche un tableau paginé et triable des contrats correspondant aux filtres."""
+    con = open_store(db_path)
+    if con is None:
+        st.info(f"Aucune base des contrats ({db_path}). Construisez-la avec : python contrats_store.py <fichier_contrats.csv>")
+        return
+
+    total = count_rows(con, filtres)
+    if total == 0:
+        st.write("Aucun contrat pour cette sélection.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sort_by = st.selectbox("Trier par", list_columns(con), index=list_columns(con).index("montant"), key=f"{key}_sort")
+    with col2:
+        ascending = st.radio("Ordre", ["Décroissant", "Croissant"], horizontal=True, key=f"{key}_order") == "Croissant"
+    with col3:
+        page_size = st.selectbox("Lignes par page", PAGE_SIZES, index=1, key=f"{key}_size")
+    n_pages = max(1, -(-total // page_size))
+    with col4:
+        page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1, key=f"{key}_page")
+
+    df_page = fetch_page(con, filtres, sort_by, ascending, int(page), page_size)
+    st.caption(f"{total} contrats — lignes {(page - 1) * page_size + 1} à {(page - 1) * page_size + len(df_page)}")
+    st.dataframe(df_page, use_container_width=True, hide_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit la base SQLite indexée des créances par contrat.")
+    parser.add_argument("source", help="Fichier CSV ou Excel des créances par contrat (colonnes annee, NOM_DR, BRANCHE, montant, ...)")
+    parser.add_argument("--db", default=DB_PATH, help="Chemin de la base SQLite")
+    args = parser.parse_args()
+
+    n_rows = build_store(args.source, args.db)
+    print(f"{n_rows} contrats importés dans {args.db}")
+
+
+if __name__ == "__main__":
+    main()
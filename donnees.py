@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+
+import bundle
+import partage
+
+logger = logging.getLogger("donnees")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+SOURCES = bundle.SOURCES
+
+# Manifeste du segment de mémoire partagée (serveur.py) : s'il est défini, les classeurs
+# sont lus dans le segment publié par le chargeur au lieu d'être chargés par ce processus
+PARTAGE = os.environ.get("DONNEES_PARTAGE")
+
+# Fichiers surveillés : les classeurs sources (ou le manifeste du segment), le pointeur du
+# bundle courant et le code des pages, dont un changement périme les figures préconstruites
+WATCHED = ([PARTAGE] if PARTAGE else SOURCES) + [bundle.CURRENT_FILE] + bundle.CODE_FILES
+
+# Période de scrutation des fichiers (secondes)
+POLL_INTERVAL = 5.0
+
+# Instantané courant des données : remplacé d'un bloc, jamais modifié sur place
+_snapshot = None
+_lock = threading.RLock()
+
+_metrics = {
+    "version": 0,
+    "rechargements": 0,
+    "echecs": 0,
+    "charge_le": None,
+    "duree_chargement": None,
+    "source": None,
+}
+
+
+def _signature():
+    """(date, taille) de chaque fichier surveillé ; None si le fichier est absent."""
+    signature = {}
+    for path in WATCHED:
+        try:
+            stat = os.stat(path)
+            signature[path] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature[path] = None
+    return signature
+
+
+def _current_bundle():
+    version = bundle.current_version()
+    if version is None:
+        return None
+    contenu = bundle.open_bundle(version)
+    return contenu if bundle.is_current(contenu["manifest"]) else None
+
+
+def validate(datasets, previous):
+    """Refuse un jeu de données vide ou qui a perdu des colonnes par rapport à l'instantané précédent."""
+    for name, df in datasets.items():
+        if df.empty:
+            raise ValueError(f"{name} est vide")
+        if previous is not None:
+            missing = set(previous["datasets"][name].columns) - set(df.columns)
+            if missing:
+                raise ValueError(f"{name} : colonnes manquantes {sorted(missing)}")
+
+
+def _build_snapshot(signature, previous):
+    """Charge un nouvel instantané complet, en réutilisant les classeurs inchangés."""
+    contenu = _current_bundle()
+    if PARTAGE:
+        manifest, datasets = partage.attach(PARTAGE)
+        # Les figures préconstruites ne sont servies que si le chargeur a publié le même bundle
+        if contenu is not None and contenu["manifest"]["version"] != manifest["bundle"]:
+            contenu = None
+    else:
+        datasets = {}
+        for name in SOURCES:
+            if contenu is not None and name in contenu["datasets"]:
+                datasets[name] = contenu["datasets"][name]
+            elif previous is not None and previous["bundle"] is None and previous["signature"].get(name) == signature.get(name):
+                datasets[name] = previous["datasets"][name]
+            else:
+                datasets[name] = pd.read_excel(name)
+    validate(datasets, previous)
+    return {"signature": signature, "datasets": datasets, "bundle": contenu}
+
+
+def _swap(snapshot, duree):
+    global _snapshot
+    with _lock:
+        _metrics["version"] += 1
+        snapshot["version"] = _metrics["version"]
+        _snapshot = snapshot
+    _metrics["charge_le"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    _metrics["duree_chargement"] = round(duree, 3)
+    if PARTAGE:
+        _metrics["source"] = "mémoire partagée"
+    elif snapshot["bundle"]:
+        _metrics["source"] = "bundle " + snapshot["bundle"]["manifest"]["version"]
+    else:
+        _metrics["source"] = "classeurs"
+
+
+def reload():
+    """Recharge les données hors du chemin des requêtes puis les publie d'un bloc.
+
+    En cas d'échec (fichier en cours d'écriture, colonnes manquantes...), l'instantané
+    précédent reste servi. Retourne True si un nouvel instantané a été publié.
+    """
+    debut = time.perf_counter()
+    signature = _signature()
+    try:
+        snapshot = _build_snapshot(signature, _snapshot)
+    except Exception:
+        _metrics["echecs"] += 1
+        logger.exception("Échec du rechargement des données, version %d conservée", _metrics["version"])
+        return False
+
+    _swap(snapshot, time.perf_counter() - debut)
+    _metrics["rechargements"] += 1
+    logger.info("Données rechargées : version %d (%s) en %.2fs", _metrics["version"], _metrics["source"], _metrics["duree_chargement"])
+    return True
+
+
+def _watch():
+    # Un fichier modifié n'est rechargé qu'une fois sa signature stable sur deux scrutations ;
+    # après un échec, il faut une nouvelle modification pour retenter
+    pending = failed = None
+    while True:
+        time.sleep(POLL_INTERVAL)
+        try:
+            signature = _signature()
+            if signature == _snapshot["signature"] or signature == failed:
+                pending = None
+            elif signature != pending:
+                pending = signature
+            else:
+                failed = None if reload() else signature
+                pending = None
+        except Exception:
+            logger.exception("Erreur du surveillant de fichiers")
+
+
+def snapshot():
+    """Instantané courant ; le premier appel du processus charge les données et lance le surveillant."""
+    if _snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                debut = time.perf_counter()
+                _swap(_build_snapshot(_signature(), None), time.perf_counter() - debut)
+                threading.Thread(target=_watch, name="donnees-watcher", daemon=True).start()
+                logger.info("Données chargées : version %d (%s)", _metrics["version"], _metrics["source"])
+    return _snapshot
+
+
+def metrics():
+    """Compteurs du rechargement à chaud (version servie, rechargements, échecs, durée)."""
+    return dict(_metrics)
+
+
+@st.cache_resource
+def _bundle_figure(version, key):
+    return pio.from_json(bundle.read_figure(version, key), skip_invalid=True)
+
+
+# Les pages prennent un instantané au début de leur exécution et le passent à load, table
+# et figure : un rechargement pendant l'exécution ne mélange pas deux versions des données.
+# Sans instantané explicite, l'instantané courant est utilisé.
+
+def load(name, snap=None):
+    """DataFrame d'un classeur source, tiré de l'instantané snap.
+
+    La même instance est partagée entre les sessions : une copie superficielle est
+    renvoyée pour que l'ajout de colonnes reste local à l'appelant.
+    """
+    snap = snap or snapshot()
+    return snap["datasets"][name].copy(deep=False)
+
+
+def table(key, builder, *args, snap=None):
+    """Agrégat préconstruit du bundle de l'instantané, ou calculé par builder(*args)."""
+    contenu = (snap or snapshot())["bundle"]
+    if contenu is not None and key in contenu["datasets"]:
+        return contenu["datasets"][key].copy(deep=False)
+    return builder(*args)
+
+
+def figure(key, builder, *args, snap=None):
+    """Figure préconstruite du bundle de l'instantané, ou construite par builder(*args)."""
+    contenu = (snap or snapshot())["bundle"]
+    if contenu is not None and key in contenu["manifest"]["figures"]:
+        return _bundle_figure(contenu["manifest"]["version"], key)
+    return builder(*args)
@@ -6,37 +6,29 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 
+import donnees
 
-def main():
-    # Charger les données localement
-    @st.cache_data
-    def load_data_dr():
-        df_dr = pd.read_excel("proba_bayesienne_DR.xlsx")
-        return df_dr
-
-    @st.cache_data
-    def load_data_br():
-        excel_file = "base_creance_branche_finale.xlsx"
-        df_br = pd.read_excel(excel_file)
-        return df_br
-
-    df_dr = load_data_dr()
-    df_br = load_data_br()
 
-    st.title("Exploration des données")
-    st.markdown(" Cette section permet d'explorer les données relatives aux créances significatives par Direction Régionale (DR) et par Branche. Vous pouvez visualiser les probabilités bayésiennes, les proportions de créances significatives, le nombre total de contrats par année, ainsi que la répartition des branches par nombre de créances significatives et par DR.")
+# Charger les données localement
+def load_data_dr(snap=None):
+    df_dr = donnees.load("proba_bayesienne_DR.xlsx", snap)
+    return df_dr
 
+def load_data_br(snap=None):
+    excel_file = "base_creance_branche_finale.xlsx"
+    df_br = donnees.load(excel_file, snap)
+    return df_br
 
-    # Section 3: Nombre total de contrats par année
-    st.markdown("### Relation entre l'évolution du nombre de contrats d'assurance et de créances signif par année")
-
+def compute_contrats_per_year(df_dr):
     # Regrouper par année et calculer le total des contrats
     contrats_per_year = df_dr.groupby("annee")["total_contrats"].sum().reset_index()
     contrats_per_year.rename(columns={"total_contrats": "nombre_total_contrats"}, inplace=True)
 
     # Ajouter une colonne pour les créances significatives
     contrats_per_year["nb_contrats_gt1000"] = df_dr.groupby("annee")["nb_contrats_gt1000"].sum().reset_index()["nb_contrats_gt1000"]
+    return contrats_per_year
 
+def generate_contrats_chart(contrats_per_year):
     # Créer une figure avec deux axes Y
     fig = make_subplots(specs=[[{"secondary_y": True}]])
 
@@ -89,18 +81,13 @@ def main():
         secondary_y=True,
         range=[0, contrats_per_year["nb_contrats_gt1000"].max() * 1.5]  # Augmenter l'échelle pour rendre le line chart plus bas
     )
+    return fig
 
-    # Afficher le graphique dans Streamlit
-    st.plotly_chart(fig, use_container_width=True)
-
-
+def generate_branches_count_chart(df_br):
     # Obtenir les années et les branches uniques
     annees = sorted(df_br['annee'].unique())
     branches = sorted(df_br['BRANCHE'].unique())
 
-    # Section 4: Répartition des branches par nombre de créances significatives par année
-    st.header("Répartition du nombre de créances significatives en fonction des branches")
-
     # Préparer les données pour le diagramme
     totaux_par_annee = df_br.groupby(['annee', 'BRANCHE'])['creance_signif'].sum().unstack(fill_value=0)
 
@@ -139,12 +126,12 @@ def main():
         legend=dict(title="Branches", orientation="h", x=0.5, xanchor="center", y=-0.2),
         template="plotly_white"
     )
+    return fig1
 
-    # Afficher le graphique dans Streamlit
-    st.plotly_chart(fig1, use_container_width=True)
-
-    # Section 4: Répartition des branches par moyenne des montants des créances significatives par année
-    st.header("Répartition des montants moyens des créances significatives en fonction des branches")
+def generate_branches_amount_chart(df_br):
+    # Obtenir les années et les branches uniques
+    annees = sorted(df_br['annee'].unique())
+    branches = sorted(df_br['BRANCHE'].unique())
 
     # Calculer la moyenne des montants des créances significatives pour chaque branche et chaque année
     moyennes_par_annee = df_br.groupby(['annee', 'BRANCHE'])['moyenne_montant_creances_sinif'].mean().unstack(fill_value=0)
@@ -184,13 +171,9 @@ def main():
         legend=dict(title="Branches", orientation="h", x=0.5, xanchor="center", y=-0.2),
         template="plotly_white"
     )
+    return fig2
 
-    # Afficher le graphique dans Streamlit
-    st.plotly_chart(fig2, use_container_width=True)
-            
-    # Section 5: Répartition des branches par créances significatives et DR
-    st.header("Répartition des créances significatives par branches et par DR")
-
+def generate_heatmap(df_br):
     # Créer une heatmap avec Plotly
     fig_heatmap = px.imshow(
         df_br.pivot_table(index="BRANCHE", columns="NOM_DR", values="creance_signif", aggfunc="sum"),
@@ -198,6 +181,69 @@ def main():
         title="Répartition des créances significatives par branches et par DR",
         color_continuous_scale="Blues"
     )
+    return fig_heatmap
+
+def prebuild():
+    """Agrégats et figures de la page pour le bundle."""
+    snap = donnees.snapshot()
+    df_dr = load_data_dr(snap)
+    df_br = load_data_br(snap)
+    contrats_per_year = compute_contrats_per_year(df_dr)
+    figures = {
+        "eda/contrats": generate_contrats_chart(contrats_per_year),
+        "eda/branches_nombre": generate_branches_count_chart(df_br),
+        "eda/branches_montant": generate_branches_amount_chart(df_br),
+        "eda/heatmap": generate_heatmap(df_br),
+    }
+    return {"tables": {"eda/contrats_per_year": contrats_per_year}, "figures": figures}
+
+def main():
+    # Un seul instantané des données pour toute l'exécution de la page
+    snap = donnees.snapshot()
+
+    df_dr = load_data_dr(snap)
+    df_br = load_data_br(snap)
+
+    st.title("Exploration des données")
+    st.markdown(" Cette section permet d'explorer les données relatives aux créances significatives par Direction Régionale (DR) et par Branche. Vous pouvez visualiser les probabilités bayésiennes, les proportions de créances significatives, le nombre total de contrats par année, ainsi que la répartition des branches par nombre de créances significatives et par DR.")
+
+
+    # Section 3: Nombre total de contrats par année
+    st.markdown("### Relation entre l'évolution du nombre de contrats d'assurance et de créances signif par année")
+
+    # Regrouper par année et calculer le total des contrats
+    contrats_per_year = donnees.table("eda/contrats_per_year", compute_contrats_per_year, df_dr, snap=snap)
+
+    # Créer une figure avec deux axes Y
+    fig = donnees.figure("eda/contrats", generate_contrats_chart, contrats_per_year, snap=snap)
+
+    # Afficher le graphique dans Streamlit
+    st.plotly_chart(fig, use_container_width=True)
+
+
+    # Section 4: Répartition des branches par nombre de créances significatives par année
+    st.header("Répartition du nombre de créances significatives en fonction des branches")
+
+    # Créer le graphique avec Plotly
+    fig1 = donnees.figure("eda/branches_nombre", generate_branches_count_chart, df_br, snap=snap)
+
+    # Afficher le graphique dans Streamlit
+    st.plotly_chart(fig1, use_container_width=True)
+
+    # Section 4: Répartition des branches par moyenne des montants des créances significatives par année
+    st.header("Répartition des montants moyens des créances significatives en fonction des branches")
+
+    # Créer le graphique avec Plotly
+    fig2 = donnees.figure("eda/branches_montant", generate_branches_amount_chart, df_br, snap=snap)
+
+    # Afficher le graphique dans Streamlit
+    st.plotly_chart(fig2, use_container_width=True)
+            
+    # Section 5: Répartition des branches par créances significatives et DR
+    st.header("Répartition des créances significatives par branches et par DR")
+
+    # Créer une heatmap avec Plotly
+    fig_heatmap = donnees.figure("eda/heatmap", generate_heatmap, df_br, snap=snap)
 
     # Afficher le graphique
     st.plotly_chart(fig_heatmap)
@@ -3,6 +3,8 @@ import eda
 import app_dr
 import app_branche
 import app_cont
+import app_alertes
+import donnees
 
 # Configurer la page pour utiliser toute la largeur
 st.set_page_config(layout="wide")
@@ -11,7 +13,7 @@ st.set_page_config(layout="wide")
 # Menu latéral pour naviguer entre les compartiments
 menu = st.sidebar.selectbox(
     "Navigation",
-    ["Exploratory Data Analysis", "Analyse par DR", "Analyse par branche", "Analyse des créances contentieuses"]
+    ["Exploratory Data Analysis", "Analyse par DR", "Analyse par branche", "Analyse des créances contentieuses", "Alertes"]
 )
 
 if menu == "Exploratory Data Analysis":
@@ -26,3 +28,10 @@ elif menu == "Analyse par branche":
 elif menu == "Analyse des créances contentieuses":
     
     app_cont.main()
+elif menu == "Alertes":
+    
+    app_alertes.main()
+
+# Version des données servies, rechargées à chaud par le surveillant de fichiers
+etat = donnees.metrics()
+st.sidebar.caption(f"Données v{etat['version']} ({etat['source']}) chargées le {etat['charge_le']} — {etat['rechargements']} rechargement(s), {etat['echecs']} échec(s)")
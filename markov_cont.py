@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipeline import RAW_CONTRATS, SEUIL_SIGNIF
+
+# États d'une créance d'une année sur l'autre ; "clôturée" est absorbant
+ETATS = ["non significative", "significative", "contentieux", "clôturée"]
+NS, S, C, F = range(len(ETATS))
+
+
+def dr_key(noms):
+    # Les noms de DR du contentieux s'écrivent sans espaces ("ALGER1") : clé commune aux deux bases
+    return noms.str.replace(" ", "", regex=False)
+
+
+def stocks_par_dr(df_creance_info, df_cont):
+    """Effectifs par état (NS, S hors contentieux, C) sous forme de tableau (annee, NOM_DR, 3).
+
+    Les couples (annee, DR) absents de la base contentieux valent NaN.
+    """
+    info = df_creance_info.assign(NOM_DR=dr_key(df_creance_info["NOM_DR"]))
+    stocks = info.groupby(["annee", "NOM_DR"])[["nb_contrats_0_1000", "nb_contrats_gt1000"]].sum()
+    # Une DR peut apparaître sur plusieurs lignes la même année : les effectifs sont cumulés
+    cont = df_cont.assign(NOM_DR=dr_key(df_cont["NOM_DR"])).groupby(["annee", "NOM_DR"])["creance_signif_cont"].sum()
+    stocks = stocks.join(cont, how="left")
+
+    annees = sorted(stocks.index.get_level_values("annee").unique())
+    drs = sorted(stocks.index.get_level_values("NOM_DR").unique())
+    stocks = stocks.reindex(pd.MultiIndex.from_product([annees, drs]))
+
+    tableau = np.stack([
+        stocks["nb_contrats_0_1000"].to_numpy(dtype=float),
+        (stocks["nb_contrats_gt1000"] - stocks["creance_signif_cont"]).to_numpy(dtype=float),
+        stocks["creance_signif_cont"].to_numpy(dtype=float),
+    ], axis=-1).reshape(len(annees), len(drs), 3)
+    return annees, drs, tableau
+
+
+def flows_from_stocks(stocks):
+    """Flux annuels estimés à partir des seuls effectifs, cumulés sur les années : (NOM_DR, 4, 4).
+
+    Sans suivi individuel des contrats, on retient l'hypothèse de flux minimaux :
+    chaque état conserve au plus l'effectif de l'année suivante, le surplus de
+    l'état aval est alimenté par l'état amont, et le reste est clôturé.
+    Toutes les DR et toutes les transitions sont traitées ensemble.
+    """
+    prev, curr = stocks[:-1], stocks[1:]
+    flux = np.zeros(prev.shape[:-1] + (4, 4))
+
+    # Contentieux : maintenu ou clôturé
+    flux[..., C, C] = np.minimum(prev[..., C], curr[..., C])
+    flux[..., C, F] = prev[..., C] - flux[..., C, C]
+
+    # Significatives : passage au contentieux, maintien, clôture
+    flux[..., S, C] = np.clip(curr[..., C] - flux[..., C, C], 0, prev[..., S])
+    flux[..., S, S] = np.minimum(prev[..., S] - flux[..., S, C], curr[..., S])
+    flux[..., S, F] = prev[..., S] - flux[..., S, C] - flux[..., S, S]
+
+    # Non significatives : passage en significative, maintien, clôture
+    flux[..., NS, S] = np.clip(curr[..., S] - flux[..., S, S], 0, prev[..., NS])
+    flux[..., NS, NS] = np.minimum(prev[..., NS] - flux[..., NS, S], curr[..., NS])
+    flux[..., NS, F] = prev[..., NS] - flux[..., NS, S] - flux[..., NS, NS]
+
+    # Les transitions dont un effectif manque sont ignorées
+    return np.nansum(flux, axis=0)
+
+
+def flows_from_raw(raw, drs):
+    """Flux comptés contrat par contrat (colonne ID_CONTRAT suivie d'une année sur l'autre) : (NOM_DR, 4, 4).
+
+    Un contrat présent une année et absent l'année suivante est compté comme clôturé.
+    """
+    raw = raw.assign(NOM_DR=dr_key(raw["NOM_DR"]))
+    signif = raw["montant"] > SEUIL_SIGNIF
+    raw["etat"] = np.where(signif & raw["contentieux"].astype(bool), C, np.where(signif, S, NS))
+
+    derniere_annee = raw["annee"].max()
+    depart = raw[raw["annee"] < derniere_annee][["ID_CONTRAT", "annee", "NOM_DR", "etat"]]
+    arrivee = raw[["ID_CONTRAT", "annee", "etat"]].assign(annee=raw["annee"] - 1)
+    paires = depart.merge(arrivee, on=["ID_CONTRAT", "annee"], how="left", suffixes=("", "_suivant"))
+    paires["etat_suivant"] = paires["etat_suivant"].fillna(F).astype(int)
+
+    flux = np.zeros((len(drs), 4, 4))
+    idx_dr = pd.Categorical(paires["NOM_DR"], categories=drs).codes
+    connus = idx_dr >= 0
+    np.add.at(flux, (idx_dr[connus], paires["etat"].to_numpy()[connus], paires["etat_suivant"].to_numpy()[connus]), 1)
+    return flux
+
+
+def transition_matrices(flux):
+    """Normalise les flux en matrices de transition (NOM_DR, 4, 4) ; un état sans effectif reste sur place."""
+    flux = flux.copy()
+    flux[..., F, F] = 1.0
+    totaux = flux.sum(axis=-1, keepdims=True)
+    identite = np.broadcast_to(np.eye(4), flux.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totaux > 0, flux / totaux, identite)
+
+
+def project(matrices, etat_initial, horizon):
+    """Distribution des effectifs sur horizon années par puissances matricielles en lot.
+
+    matrices : (NOM_DR, 4, 4) ; etat_initial : (NOM_DR, 4). Retourne (NOM_DR, horizon + 1, 4).
+    """
+    puissances = np.stack([np.linalg.matrix_power(matrices, h) for h in range(horizon + 1)], axis=1)
+    return np.einsum("dk,dhkj->dhj", etat_initial, puissances)
+
+
+def fit(df_creance_info, df_cont, raw_path=RAW_CONTRATS):
+    """Ajuste une matrice de transition par DR.
+
+    Les flux sont comptés sur les données brutes quand elles suivent les contrats
+    (ID_CONTRAT), sinon estimés à partir des effectifs des deux bases. Dans ce cas,
+    une DR absente de la base contentieux n'a ni état S ni état C connus : elle est
+    écartée plutôt que de recevoir une matrice identité sans données.
+    Retourne (annees, drs, stocks, matrices, source).
+    """
+    annees, drs, stocks = stocks_par_dr(df_creance_info, df_cont)
+
+    raw = pd.read_csv(raw_path) if os.path.exists(raw_path) else None
+    if raw is not None and "ID_CONTRAT" in raw.columns:
+        flux, source = flows_from_raw(raw, drs), "contrats"
+    else:
+        connues = ~np.isnan(stocks[..., C]).all(axis=0)
+        drs, stocks = [dr for dr, connue in zip(drs, connues) if connue], stocks[:, connues]
+        flux, source = flows_from_stocks(stocks), "effectifs"
+
+    return annees, drs, stocks, transition_matrices(flux), source
@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Manifeste du segment courant, publié par le chargeur (serveur.py) et lu par les réplicas
+MANIFEST = "partage.json"
+
+# Alignement des colonnes dans le segment (octets)
+ALIGN = 64
+
+# Segments rattachés par ce processus ; les plus anciens sont fermés dès qu'ils ne sont plus utilisés
+_attached = {}
+KEEP_ATTACHED = 2
+
+
+def _columns(df):
+    """Colonnes à placer dans le segment : valeurs numériques, ou codes entiers et catégories pour le texte."""
+    for column in df.columns:
+        values = df[column]
+        if values.dtype.kind in "iufb":
+            yield {"name": column, "kind": "numeric"}, values.to_numpy()
+        else:
+            codes, categories = pd.factorize(values)
+            yield {"name": column, "kind": "category", "categories": [str(c) for c in categories]}, codes.astype(np.int32)
+
+
+def publish(datasets, version, manifest_path=MANIFEST, bundle_version=None):
+    """Copie les colonnes de tous les jeux de données dans un nouveau segment de mémoire partagée.
+
+    Le manifeste (nom du segment, position et type de chaque colonne, version du bundle
+    dont proviennent les données) est publié en remplaçant le précédent, de sorte qu'un
+    réplica ne lit jamais un segment incomplet.
+    Retourne le segment, que le chargeur garde ouvert tant qu'il peut être rattaché.
+    """
+    layout = {}
+    arrays = []
+    offset = 0
+    for name, df in datasets.items():
+        columns = []
+        for meta, values in _columns(df):
+            offset = -(-offset // ALIGN) * ALIGN
+            meta.update(dtype=values.dtype.str, offset=offset)
+            columns.append(meta)
+            arrays.append((offset, values))
+            offset += values.nbytes
+        layout[name] = {"rows": len(df), "columns": columns}
+
+    segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for start, values in arrays:
+        np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf, offset=start)[:] = values
+
+    manifest = {
+        "segment": segment.name,
+        "version": version,
+        "bundle": bundle_version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "size": segment.size,
+        "datasets": layout,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    return segment
+
+
+def retire(segment):
+    """Détruit un segment publié ; les réplicas qui l'ont rattaché gardent leur projection."""
+    segment.close()
+    segment.unlink()
+
+
+def _open_segment(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    segment = shared_memory.SharedMemory(name)
+    # Avant Python 3.13, le resource_tracker détruirait le segment à la sortie du réplica
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def _close_unused():
+    for name in list(_attached)[:-KEEP_ATTACHED]:
+        try:
+            _attached[name].close()
+        except BufferError:
+            # Des tableaux de cette version sont encore référencés
+            continue
+        del _attached[name]
+
+
+def attach(manifest_path=MANIFEST):
+    """Jeux de données du segment courant, en lecture seule et sans copie des colonnes numériques.
+
+    Les colonnes texte sont décodées dans le processus à partir de leurs codes.
+    Retourne (manifeste, {nom: DataFrame}).
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    segment = _attached.get(manifest["segment"]) or _open_segment(manifest["segment"])
+    _attached[manifest["segment"]] = segment
+
+    datasets = {}
+    for name, meta in manifest["datasets"].items():
+        data = {}
+        for column in meta["columns"]:
+            values = np.ndarray(meta["rows"], dtype=column["dtype"], buffer=segment.buf, offset=column["offset"])
+            values.flags.writeable = False
+            if column["kind"] == "category":
+                categories = np.array(column["categories"] + [None], dtype=object)
+                # Le code -1 (valeur manquante) pointe sur le None final
+                values = categories[values]
+            data[column["name"]] = values
+        datasets[name] = pd.DataFrame(data, copy=False)
+
+    _close_unused()
+    return manifest, datasets
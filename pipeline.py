@@ -0,0 +1,361 @@
+import argparse
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+import contrats_store
+
+logger = logging.getLogger("pipeline")
+
+# Données brutes au niveau contrat (annee, NOM_DR, CODE_DR, BRANCHE, montant, contentieux)
+RAW_CONTRATS = "creances_contrats.csv"
+# Probabilités a priori par DR et par année (annee, NOM_DR, proba_a_priori), facultatif
+RAW_PRIORS = "priors_dr.csv"
+
+FICHIER_INFO = "base_creance_info_v3.xlsx"
+FICHIER_BRANCHE = "base_creance_branche_finale.xlsx"
+FICHIER_DR = "proba_bayesienne_DR.xlsx"
+FICHIER_DR_V2 = "base_creance_DR_v2.xlsx"
+FICHIER_CONT = "base_contentieux_finale_v2.xlsx"
+
+CACHE_FILE = ".pipeline_cache.json"
+
+RAW_COLUMNS = ["annee", "NOM_DR", "CODE_DR", "BRANCHE", "montant", "contentieux"]
+
+# Seuil de montant au-delà duquel une créance est significative
+SEUIL_SIGNIF = 1000
+
+
+def read_raw(path):
+    raw = pd.read_csv(path)
+    missing = [c for c in RAW_COLUMNS if c not in raw.columns]
+    if missing:
+        raise ValueError(f"Colonnes manquantes dans {path} : {missing}")
+    return raw
+
+
+def creance_id(df):
+    # Identifiant DR-année utilisé dans les classeurs : 2019 + DR 11 -> 201911
+    return df["annee"] * 100 + df["CODE_DR"]
+
+
+def add_branch_posteriors(df):
+    """Ajoute les colonnes bayésiennes par branche à la base créance info.
+
+    P(B | DR) = nb_signif(DR, B) / nb_signif(DR)
+    P(B) = somme sur les DR de P(DR) * P(B | DR)   (probabilités totales)
+    P(DR | B) = P(DR) * P(B | DR) / P(B)
+    """
+    df = df.copy()
+    group_dr = df.groupby(["annee", "NOM_DR"])
+    df["sum_nb_contrats_gt1000"] = group_dr["nb_contrats_gt1000"].transform("sum")
+    df["sum_total_contrats"] = group_dr["total_contrats"].transform("sum")
+
+    df["fraction_contrats"] = (df["nb_contrats_gt1000"] / df["sum_nb_contrats_gt1000"]).fillna(0.0)
+    df["proba_cond_BRANCHE"] = df["fraction_contrats"]
+    df["weighted_contribution"] = df["proba_a_priori"] * df["fraction_contrats"]
+    df["proba_marg_BRANCHE"] = df.groupby(["annee", "BRANCHE"])["weighted_contribution"].transform("sum")
+    df["proba_bayesienne_BRANCHE"] = (df["weighted_contribution"] / df["proba_marg_BRANCHE"]).fillna(0.0)
+    return df
+
+
+def build_creance_info(inputs, outputs):
+    """Étape brut -> base créance info : agrégats par (annee, DR, branche) et a priori par DR."""
+    raw = read_raw(inputs[0])
+    raw["signif"] = raw["montant"] > SEUIL_SIGNIF
+    raw["montant_signif"] = raw["montant"].where(raw["signif"])
+    raw["montant_non_signif"] = raw["montant"].where(~raw["signif"])
+
+    df = raw.groupby(["annee", "NOM_DR", "CODE_DR", "BRANCHE"]).agg(
+        nb_contrats_gt1000=("signif", "sum"),
+        total_contrats=("montant", "size"),
+        moyenne_creances_gt1000=("montant_signif", "mean"),
+        moyenne_creances_0_1000=("montant_non_signif", "mean"),
+    ).reset_index()
+    df["nb_contrats_0_1000"] = df["total_contrats"] - df["nb_contrats_gt1000"]
+    df[["moyenne_creances_gt1000", "moyenne_creances_0_1000"]] = df[["moyenne_creances_gt1000", "moyenne_creances_0_1000"]].fillna(0.0)
+    df["ID"] = creance_id(df)
+
+    # A priori par DR : fichier fourni, sinon taux empirique de créances significatives
+    if len(inputs) > 1 and os.path.exists(inputs[1]):
+        priors = pd.read_csv(inputs[1])[["annee", "NOM_DR", "proba_a_priori"]]
+        df = df.merge(priors, on=["annee", "NOM_DR"], how="left")
+    else:
+        totals = df.groupby(["annee", "NOM_DR"])[["nb_contrats_gt1000", "total_contrats"]].transform("sum")
+        df["proba_a_priori"] = totals["nb_contrats_gt1000"] / totals["total_contrats"]
+
+    df = add_branch_posteriors(df)
+    columns = ["annee", "NOM_DR", "CODE_DR", "ID", "BRANCHE", "nb_contrats_gt1000", "nb_contrats_0_1000",
+               "total_contrats", "moyenne_creances_gt1000", "moyenne_creances_0_1000", "proba_a_priori",
+               "proba_marg_BRANCHE", "sum_nb_contrats_gt1000", "proba_cond_BRANCHE", "proba_bayesienne_BRANCHE",
+               "sum_total_contrats", "fraction_contrats", "weighted_contribution"]
+    df[columns].sort_values(["annee", "NOM_DR", "BRANCHE"]).to_excel(outputs[0], index=False)
+
+
+def build_branch_posteriors(inputs, outputs):
+    """Étape base créance info -> base par branche (mêmes probabilités, libellés du tableau de bord)."""
+    df = add_branch_posteriors(pd.read_excel(inputs[0]))
+    df = df.rename(columns={
+        "nb_contrats_gt1000": "creance_signif",
+        "nb_contrats_0_1000": "creance_nan_sinif",
+        "moyenne_creances_gt1000": "moyenne_montant_creances_sinif",
+        "moyenne_creances_0_1000": "moyenne_creances_non_signif",
+        "proba_marg_BRANCHE": "proba_marginale",
+        "sum_nb_contrats_gt1000": "creance_signif_par_dr",
+        "proba_cond_BRANCHE": "proba_cond",
+        "proba_bayesienne_BRANCHE": "proba_bayesienne",
+        "sum_total_contrats": "sum_total_contrats_par_dr",
+    })
+    columns = ["annee", "NOM_DR", "CODE_DR", "ID", "BRANCHE", "creance_signif", "creance_nan_sinif", "total_contrats",
+               "moyenne_montant_creances_sinif", "moyenne_creances_non_signif", "proba_a_priori", "proba_marginale",
+               "creance_signif_par_dr", "proba_cond", "proba_bayesienne", "sum_total_contrats_par_dr"]
+    df[columns].to_excel(outputs[0], index=False)
+
+
+def build_dr_posteriors(inputs, outputs):
+    """Étape base créance info -> probabilités bayésiennes par DR.
+
+    P(signif) = moyenne des a priori DR pondérée par le nombre de contrats
+    P(DR | signif) = P(signif) * P(DR parmi les signif) / P(DR parmi les contrats)
+    """
+    info = pd.read_excel(inputs[0])
+    df = info.groupby(["annee", "NOM_DR"]).agg(
+        CODE_DR=("CODE_DR", "first"),
+        nb_contrats_gt1000=("nb_contrats_gt1000", "sum"),
+        total_contrats=("total_contrats", "sum"),
+        moyenne_montant_creances_sinif=("moyenne_creances_gt1000", "mean"),
+        proba_a_priori=("proba_a_priori", "first"),
+    ).reset_index()
+
+    group_year = df.groupby("annee")
+    df["proba_cond_dr"] = df["nb_contrats_gt1000"] / group_year["nb_contrats_gt1000"].transform("sum")
+    df["proba_marg_dr"] = df["total_contrats"] / group_year["total_contrats"].transform("sum")
+    prior_national = (df["proba_a_priori"] * df["proba_marg_dr"]).groupby(df["annee"]).transform("sum")
+    df["proba_bayesienne"] = prior_national * df["proba_cond_dr"] / df["proba_marg_dr"]
+
+    df_dr = df.sort_values(["annee", "proba_bayesienne"], ascending=[True, False])
+    df_dr[["NOM_DR", "annee", "total_contrats", "nb_contrats_gt1000", "proba_marg_dr", "proba_cond_dr",
+           "proba_bayesienne"]].to_excel(outputs[0], index=False)
+
+    # Base DR v2 : effectifs agrégés, moyenne des montants moyens par branche et a priori de chaque DR
+    df["creance_signif"] = df["nb_contrats_gt1000"]
+    df["proba_bayesienne"] = df["proba_a_priori"]
+    df[["annee", "NOM_DR", "CODE_DR", "creance_signif", "total_contrats", "moyenne_montant_creances_sinif",
+        "proba_bayesienne"]].to_excel(outputs[1], index=False)
+
+
+def build_contentieux(inputs, outputs):
+    """Étape brut + base créance info -> probabilités bayésiennes des créances contentieuses par DR."""
+    raw = read_raw(inputs[0])
+    info = pd.read_excel(inputs[1])
+
+    raw["cont_signif"] = raw["contentieux"].astype(bool) & (raw["montant"] > SEUIL_SIGNIF)
+    raw["montant_cont"] = raw["montant"].where(raw["cont_signif"], 0.0)
+    cont = raw.groupby(["annee", "NOM_DR"]).agg(
+        creance_signif_cont=("cont_signif", "sum"),
+        somme_montant_creance=("montant_cont", "sum"),
+    ).reset_index()
+
+    df = info.groupby(["annee", "NOM_DR"]).agg(
+        CODE_DR=("CODE_DR", "first"),
+        sum_creance_signif=("nb_contrats_gt1000", "sum"),
+        total_contrats=("total_contrats", "sum"),
+        proba_a_priori=("proba_a_priori", "first"),
+    ).reset_index().merge(cont, on=["annee", "NOM_DR"], how="inner")
+
+    df["ID"] = creance_id(df)
+    df["proba_conditionnelle"] = df["creance_signif_cont"] / df["sum_creance_signif"]
+    df["proba_marginale"] = (df["proba_a_priori"] * df["proba_conditionnelle"]).groupby(df["annee"]).transform("sum")
+    df["proba_bayesienne"] = df["proba_a_priori"] * df["proba_conditionnelle"] / df["proba_marginale"]
+    # Les noms de DR du contentieux s'écrivent sans espaces ("ALGER1")
+    df["NOM_DR"] = df["NOM_DR"].str.replace(" ", "", regex=False)
+
+    df[["annee", "NOM_DR", "ID", "creance_signif_cont", "sum_creance_signif", "somme_montant_creance",
+        "total_contrats", "proba_a_priori", "proba_conditionnelle", "proba_marginale",
+        "proba_bayesienne"]].to_excel(outputs[0], index=False)
+
+
+def build_contract_store(inputs, outputs):
+    """Étape brut -> base SQLite indexée des contrats (tables de détail du tableau de bord)."""
+    contrats_store.build_store(inputs[0], outputs[0])
+
+
+# Étapes du pipeline : les dépendances se déduisent des fichiers produits par les autres étapes.
+# "code" liste les fonctions et modules auxiliaires et "constants" les constantes utilisés
+# par l'étape : avec le code de sa fonction, ils forment l'empreinte de la transformation.
+STAGES = {
+    "creance_info": {
+        "inputs": [RAW_CONTRATS, RAW_PRIORS], "outputs": [FICHIER_INFO], "func": build_creance_info,
+        "code": [read_raw, creance_id, add_branch_posteriors],
+        "constants": {"RAW_COLUMNS": RAW_COLUMNS, "SEUIL_SIGNIF": SEUIL_SIGNIF},
+    },
+    "contrats": {
+        "inputs": [RAW_CONTRATS], "outputs": [contrats_store.DB_PATH], "func": build_contract_store,
+        "code": [contrats_store],
+    },
+    "branche": {
+        "inputs": [FICHIER_INFO], "outputs": [FICHIER_BRANCHE], "func": build_branch_posteriors,
+        "code": [add_branch_posteriors],
+    },
+    "dr": {
+        "inputs": [FICHIER_INFO], "outputs": [FICHIER_DR, FICHIER_DR_V2], "func": build_dr_posteriors,
+    },
+    "contentieux": {
+        "inputs": [RAW_CONTRATS, FICHIER_INFO], "outputs": [FICHIER_CONT], "func": build_contentieux,
+        "code": [read_raw, creance_id],
+        "constants": {"RAW_COLUMNS": RAW_COLUMNS, "SEUIL_SIGNIF": SEUIL_SIGNIF},
+    },
+}
+
+# Entrées facultatives : leur absence ne bloque pas l'étape
+OPTIONAL_INPUTS = {RAW_PRIORS}
+
+
+def file_hash(path):
+    """Empreinte SHA-256 du contenu d'un fichier, ou None s'il n'existe pas."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(path):
+    """Empreinte du contenu d'un fichier, ou None s'il n'existe pas.
+
+    Un classeur Excel est haché sur le tableau lu (colonnes, types, valeurs) : openpyxl
+    horodate chaque fichier écrit, deux écritures des mêmes données diffèrent octet à octet.
+    """
+    if not path.endswith(".xlsx") or not os.path.exists(path):
+        return file_hash(path)
+    df = pd.read_excel(path)
+    digest = hashlib.sha256()
+    digest.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def stage_dependencies(stages):
+    producers = {output: name for name, stage in stages.items() for output in stage["outputs"]}
+    return {
+        name: {producers[i] for i in stage["inputs"] if i in producers and producers[i] != name}
+        for name, stage in stages.items()
+    }
+
+
+def code_hash(objects):
+    """Empreinte SHA-256 du code source d'une liste de fonctions ou de modules."""
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+
+def stage_key(stage):
+    # La clé couvre le contenu des entrées et le code de la transformation : la fonction de
+    # l'étape, ses auxiliaires déclarés et la valeur des constantes qu'elle utilise
+    func = stage["func"]
+    return {
+        "func": f"{func.__module__}.{func.__qualname__}",
+        "code": code_hash([func] + stage.get("code", [])),
+        "constants": {name: repr(value) for name, value in stage.get("constants", {}).items()},
+        "inputs": {path: content_hash(path) for path in stage["inputs"]},
+    }
+
+
+def load_cache(path=CACHE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_cache(cache, path=CACHE_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def run_stage(func, inputs, outputs):
+    debut = time.perf_counter()
+    func(inputs, outputs)
+    return time.perf_counter() - debut
+
+
+def run_pipeline(stages=STAGES, force=False, max_workers=None, cache_path=CACHE_FILE):
+    """Exécute les étapes dont les entrées ont changé, les étapes indépendantes en parallèle.
+
+    Une étape est sautée si l'empreinte de ses entrées est celle du dernier passage et
+    que ses sorties n'ont pas été modifiées depuis. Une étape dont une entrée
+    obligatoire manque garde ses sorties actuelles comme sources.
+    Retourne un dict {étape: "exécutée" | "à jour" | "source"}.
+    """
+    cache = load_cache(cache_path)
+    dependencies = stage_dependencies(stages)
+    status = {}
+    pending = dict(dependencies)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # Lancer toutes les étapes dont les dépendances sont terminées
+            for name in [n for n, deps in pending.items() if deps <= status.keys()]:
+                del pending[name]
+                stage = stages[name]
+                missing = [i for i in stage["inputs"] if i not in OPTIONAL_INPUTS and not os.path.exists(i)]
+                if missing:
+                    logger.info("%s : entrée absente %s, sorties conservées", name, missing)
+                    status[name] = "source"
+                    continue
+
+                key = stage_key(stage)
+                previous = cache.get(name, {})
+                hashes = {o: content_hash(o) for o in stage["outputs"]}
+                outputs_unchanged = None not in hashes.values() and previous.get("outputs") == hashes
+                if not force and previous.get("key") == key and outputs_unchanged:
+                    logger.info("%s : à jour", name)
+                    status[name] = "à jour"
+                    continue
+
+                logger.info("%s : exécution", name)
+                future = executor.submit(run_stage, stage["func"], stage["inputs"], stage["outputs"])
+                running[future] = (name, key)
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                duree = future.result()
+                cache[name] = {"key": key, "outputs": {o: content_hash(o) for o in stages[name]["outputs"]}}
+                save_cache(cache, cache_path)
+                logger.info("%s : terminé en %.2fs", name, duree)
+                status[name] = "exécutée"
+
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Régénère les classeurs dérivés à partir des données brutes.")
+    parser.add_argument("--force", action="store_true", help="Réexécuter toutes les étapes")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus parallèles")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    status = run_pipeline(force=args.force, max_workers=args.workers)
+    for name, etat in status.items():
+        print(f"{name:<14} {etat}")
+
+
+if __name__ == "__main__":
+    main()
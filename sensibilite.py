@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from alertes import build_cube
+
+# Grille par défaut : multiplicateurs de la moyenne a priori nationale et forces (en nombre de contrats fictifs)
+FACTEURS_MOYENNE = np.linspace(0.5, 2.0, 7)
+FORCES = np.array([0, 10, 100, 1_000, 10_000])
+
+TOP_N = 3
+
+
+def posterior_grid(k, n, moyennes, forces):
+    """Moyenne a posteriori Beta-binomiale (k + s * m) / (n + s) pour toute la grille à la fois.
+
+    k, n : effectifs de forme (annee, ...) ; moyennes : (M, annee) ; forces : (S,).
+    Retourne un tableau (M, S, annee, ...). Une force nulle redonne le taux observé k / n.
+    """
+    extra = (1,) * (k.ndim - 1)
+    m = moyennes.reshape(moyennes.shape[0], 1, moyennes.shape[1], *extra)
+    s = forces.reshape(1, -1, 1, *extra)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (k + s * m) / (n + s)
+
+
+def rank_desc(values, axis):
+    """Rang (0 = plus risqué) le long de axis ; les NaN sont classés en dernier."""
+    order = np.argsort(-np.nan_to_num(values, nan=-np.inf), axis=axis, kind="stable")
+    return np.argsort(order, axis=axis, kind="stable")
+
+
+def rank_stability(df_creance_info, facteurs=FACTEURS_MOYENNE, forces=FORCES, top_n=TOP_N):
+    """Stabilité du classement des DR quand l'a priori varie.
+
+    Les effectifs des branches sont cumulés par DR, puis le taux de créances
+    significatives de chaque DR est lissé vers une moyenne a priori commune (moyenne
+    nationale × facteur) avec une force donnée, pour toute la grille en une seule
+    opération.
+
+    Retourne un DataFrame avec une ligne par (annee, NOM_DR) : fréquence de présence
+    dans le top N, rangs extrêmes et moyen, et rang observé.
+    """
+    annees, drs, branches, k, n = build_cube(df_creance_info, "nb_contrats_gt1000", "total_contrats")
+    # Effectifs par (annee, NOM_DR), toutes branches confondues
+    k, n = np.nan_to_num(k).sum(axis=2), np.nan_to_num(n).sum(axis=2)
+
+    # Moyenne a priori nationale par année, déclinée sur la grille de facteurs : (M, annee)
+    taux_national = k.sum(axis=1) / n.sum(axis=1)
+    moyennes = np.asarray(facteurs)[:, None] * taux_national[None, :]
+    forces = np.asarray(forces, dtype=float)
+
+    # Rangs des DR pour chaque point de la grille et chaque année : (M, S, annee, NOM_DR)
+    rangs = rank_desc(posterior_grid(k, n, moyennes, forces), axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rang_observe = rank_desc(k / n, axis=-1)
+
+    df = pd.MultiIndex.from_product([annees, drs], names=["annee", "NOM_DR"]).to_frame(index=False)
+    df["rang_observe"] = rang_observe.ravel() + 1
+    df[f"frequence_top{top_n}"] = (rangs < top_n).mean(axis=(0, 1)).ravel()
+    df["rang_min"] = rangs.min(axis=(0, 1)).ravel() + 1
+    df["rang_max"] = rangs.max(axis=(0, 1)).ravel() + 1
+    df["rang_moyen"] = rangs.mean(axis=(0, 1)).ravel() + 1
+    return df
@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import bundle
+import donnees
+import partage
+
+logger = logging.getLogger("serveur")
+
+# Port public du proxy et premier port des réplicas Streamlit
+PORT = 8501
+PREMIER_PORT_REPLICA = 8511
+
+BUFFER = 64 * 1024
+
+
+def start_replicas(n, premier_port, manifest_path):
+    """Lance n processus Streamlit rattachés au segment partagé, chacun sur son port local."""
+    env = dict(os.environ, DONNEES_PARTAGE=os.path.abspath(manifest_path))
+    replicas = []
+    for i in range(n):
+        commande = [
+            sys.executable, "-m", "streamlit", "run", "main.py",
+            "--server.port", str(premier_port + i),
+            "--server.address", "127.0.0.1",
+            "--server.headless", "true",
+            "--server.enableCORS", "false",
+            "--server.enableXsrfProtection", "false",
+        ]
+        replicas.append(subprocess.Popen(commande, env=env))
+    return replicas
+
+
+def publish(snapshot, manifest_path):
+    """Publie les jeux de données d'un instantané, avec la version du bundle qui les accompagne."""
+    bundle_version = snapshot["bundle"]["manifest"]["version"] if snapshot["bundle"] else None
+    return partage.publish(snapshot["datasets"], snapshot["version"], manifest_path, bundle_version)
+
+
+def republish(segments, manifest_path):
+    """Publie un nouveau segment à chaque rechargement à chaud des données du chargeur.
+
+    Le segment précédent reste disponible pour les réplicas en cours de rattachement ;
+    les plus anciens sont détruits.
+    """
+    version = donnees.snapshot()["version"]
+    while True:
+        time.sleep(donnees.POLL_INTERVAL)
+        snapshot = donnees.snapshot()
+        if snapshot["version"] == version:
+            continue
+        version = snapshot["version"]
+        segments.append(publish(snapshot, manifest_path))
+        logger.info("Segment %s publié (données version %d)", segments[-1].name, version)
+        while len(segments) > 2:
+            partage.retire(segments.pop(0))
+
+
+async def _pipe(reader, writer):
+    try:
+        while data := await reader.read(BUFFER):
+            writer.write(data)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def proxy(port, backends):
+    """Proxy TCP local : chaque connexion est confiée au réplica qui en a le moins.
+
+    Une session Streamlit vit sur sa connexion websocket, qui reste sur le même
+    réplica ; le proxy n'a donc pas besoin d'analyser le trafic HTTP.
+    """
+    connexions = dict.fromkeys(backends, 0)
+
+    async def handle(client_reader, client_writer):
+        for backend in sorted(backends, key=connexions.get):
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", backend)
+                break
+            except OSError:
+                continue
+        else:
+            client_writer.close()
+            return
+
+        connexions[backend] += 1
+        try:
+            await asyncio.gather(_pipe(client_reader, writer), _pipe(reader, client_writer), return_exceptions=True)
+        finally:
+            connexions[backend] -= 1
+
+    server = await asyncio.start_server(handle, "0.0.0.0", port)
+    logger.info("Proxy à l'écoute sur le port %d, réplicas %s", port, backends)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sert l'application avec plusieurs réplicas Streamlit partageant un segment de données.")
+    parser.add_argument("--replicas", type=int, default=os.cpu_count(), help="Nombre de processus Streamlit")
+    parser.add_argument("--port", type=int, default=PORT, help="Port public du proxy")
+    parser.add_argument("--premier-port", type=int, default=PREMIER_PORT_REPLICA, help="Port du premier réplica")
+    parser.add_argument("--manifest", default=partage.MANIFEST, help="Manifeste du segment partagé")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # Bundle reconstruit si les classeurs ou le code des pages ont changé depuis sa publication
+    logger.info("Bundle %s", bundle.build())
+
+    # Le chargeur lit les données une seule fois et les publie pour tous les réplicas ;
+    # la construction du bundle a pu charger les classeurs avant sa publication
+    donnees.snapshot()
+    donnees.reload()
+    snapshot = donnees.snapshot()
+    segments = [publish(snapshot, args.manifest)]
+    logger.info("Segment %s publié (%d octets)", segments[0].name, segments[0].size)
+    threading.Thread(target=republish, args=(segments, args.manifest), name="serveur-publication", daemon=True).start()
+
+    # Un arrêt par SIGTERM arrête aussi les réplicas et détruit les segments
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    replicas = start_replicas(args.replicas, args.premier_port, args.manifest)
+    try:
+        asyncio.run(proxy(args.port, [args.premier_port + i for i in range(args.replicas)]))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Un second signal ne doit pas interrompre l'arrêt
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for replica in replicas:
+            replica.terminate()
+        for replica in replicas:
+            replica.wait()
+        for segment in segments:
+            partage.retire(segment)
+        if os.path.exists(args.manifest):
+            os.remove(args.manifest)
+
+
+if __name__ == "__main__":
+    main()